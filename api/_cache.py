@@ -0,0 +1,159 @@
+"""
+Bounded in-memory TTL cache shared by the live search APIs
+- LRU eviction within an entry count and approximate byte budget
+- Stale-while-revalidate: an expired entry is still served for a grace
+  period while a single background task refreshes it
+"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+import asyncio
+import logging
+import sys
+import time
+
+from _singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Results of get_or_fetch
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Rough deep size in bytes of a cached value (dicts, lists, models, scalars)"""
+    size = sys.getsizeof(value)
+    if _depth > 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in value)
+    elif hasattr(value, '__dict__'):
+        size += approx_size(vars(value), _depth + 1)
+    return size
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires: float       # monotonic time the entry stops being fresh
+    stale_until: float   # monotonic time it can no longer be served
+
+
+class TTLCache:
+    """LRU + TTL cache with an entry and byte budget"""
+
+    def __init__(self, ttl: float, stale_ttl: Optional[float] = None,
+                 max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 sizeof: Callable[[Any], int] = approx_size,
+                 flights: Optional[SingleFlight] = None):
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.flights = flights or SingleFlight()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """(value, is_fresh) if the key can still be served, else None"""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now >= entry.stale_until:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if now < entry.expires:
+            self.hits += 1
+            return entry.value, True
+        self.stale_hits += 1
+        return entry.value, False
+
+    def set(self, key: str, value: Any):
+        """Store value, evicting least recently used entries over budget"""
+        size = self.sizeof(value)
+        self._remove(key)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {key}: {size} bytes exceeds the cache budget")
+            return
+
+        now = time.monotonic()
+        self._entries[key] = _Entry(value, size, now + self.ttl, now + self.ttl + self.stale_ttl)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def spawn(self, key: str, fetch: Callable[[], Awaitable[Any]]):
+        """
+        Run fetch() in the background under the single-flight key, for
+        refreshes that store their own results (e.g. several keys at once)
+        """
+        async def refresh():
+            try:
+                await self.flights.do(key, fetch)
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed: {e}")
+
+        task = asyncio.ensure_future(refresh())
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Get key, fetching it on a miss
+
+        Returns (value, FRESH | STALE | MISS). A stale value is returned
+        immediately and refreshed in the background; concurrent misses
+        and refreshes for a key share one fetch.
+        """
+        found = self.lookup(key)
+        if found is not None:
+            value, is_fresh = found
+            if is_fresh:
+                return value, FRESH
+            self.spawn(key, lambda: self._fetch_and_store(key, fetch))
+            return value, STALE
+
+        value = await self.flights.do(key, lambda: self._fetch_and_store(key, fetch))
+        return value, MISS
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,392 @@
+"""
+Read-only SQLite store of the combined clinic dataset
+Built by scripts/combine_all_data.py; the APIs open it via mmap instead of
+parsing the JSON dataset and building indexes on every cold start
+
+Tables:
+    clinics            one row per clinic (id = position in the dataset),
+                       scalar fields, facet flags and the original JSON
+    services,          normalized (lowercased) values, linked through
+    languages          clinic_services / clinic_languages
+    clinics_fts        FTS5 trigram index over lowercased name, address,
+                       services and languages (substring search)
+    clinics_rtree      R*Tree over clinic coordinates
+    meta               schema version, data version, aggregates
+"""
+
+from math import pi
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import logging
+import sqlite3
+
+from _geo import EARTH_RADIUS_KM, batch_distances, bounding_box
+from _search_index import FACET_FIELDS, ClinicRecord, compile_record, compute_aggregates, outward_code
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+# Queries shorter than a trigram can't use the FTS index
+TRIGRAM_SIZE = 3
+
+# First radius tried by nearest(); doubled until k clinics are inside
+NEAREST_START_KM = 1.0
+
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = f"""
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE clinics (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    address TEXT,
+    phone TEXT,
+    email TEXT,
+    link TEXT,
+    area TEXT,
+    postcode TEXT,
+    outward_code TEXT,
+    lat REAL,
+    lon REAL,
+    rating REAL,
+    opening_hours TEXT,
+    source TEXT,
+    {', '.join(f'{field} INTEGER' for field in FACET_FIELDS)},
+    data TEXT NOT NULL
+);
+CREATE INDEX clinics_outward_code ON clinics (outward_code);
+CREATE TABLE services (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE languages (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE clinic_services (
+    service_id INTEGER NOT NULL REFERENCES services (id),
+    clinic_id INTEGER NOT NULL REFERENCES clinics (id),
+    PRIMARY KEY (service_id, clinic_id)
+) WITHOUT ROWID;
+CREATE TABLE clinic_languages (
+    language_id INTEGER NOT NULL REFERENCES languages (id),
+    clinic_id INTEGER NOT NULL REFERENCES clinics (id),
+    PRIMARY KEY (language_id, clinic_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE clinics_fts USING fts5 (name, address, services, languages, tokenize='trigram');
+CREATE VIRTUAL TABLE clinics_rtree USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+"""
+
+
+def _flag(value: Any) -> Optional[int]:
+    """Facet column value: 1, 0, or NULL when unknown (as in ClinicIndex)"""
+    if value == True:
+        return 1
+    if value == False:
+        return 0
+    return None
+
+
+def _value_ids(conn: sqlite3.Connection, table: str, values: Iterable[str],
+               ids: Dict[str, int]) -> List[int]:
+    """Ids of normalized values, inserting new ones"""
+    result = []
+    for value in dict.fromkeys(values):
+        if value not in ids:
+            ids[value] = conn.execute(f"INSERT INTO {table} (name) VALUES (?)", (value,)).lastrowid
+        result.append(ids[value])
+    return result
+
+
+def write_store(path: Path, clinics: List[Dict], data_version: str) -> Dict:
+    """Build the store for clinics at path (atomically replacing it)"""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(str(tmp_path))
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+
+        service_ids = {}
+        language_ids = {}
+        located = 0
+        for position, clinic in enumerate(clinics):
+            postcode = clinic.get('postcode') or ''
+            lat, lon = clinic.get('lat'), clinic.get('lon')
+            conn.execute(
+                f"INSERT INTO clinics VALUES ({', '.join('?' * (15 + len(FACET_FIELDS)))})",
+                (position, clinic.get('name') or '', clinic.get('address'), clinic.get('phone'),
+                 clinic.get('email'), clinic.get('link'), clinic.get('area'), clinic.get('postcode'),
+                 outward_code(postcode), lat, lon, clinic.get('rating'), clinic.get('opening_hours'),
+                 clinic.get('source'),
+                 *(_flag(clinic.get(field)) for field in FACET_FIELDS),
+                 json.dumps(clinic, ensure_ascii=False, separators=(',', ':'))),
+            )
+
+            services = [s.lower() for s in clinic.get('services') or []]
+            languages = [l.lower() for l in clinic.get('languages') or []]
+            conn.executemany("INSERT INTO clinic_services VALUES (?, ?)",
+                             [(i, position) for i in _value_ids(conn, 'services', services, service_ids)])
+            conn.executemany("INSERT INTO clinic_languages VALUES (?, ?)",
+                             [(i, position) for i in _value_ids(conn, 'languages', languages, language_ids)])
+            # Values are joined with newlines, which queries never contain,
+            # so a match can't span two values
+            conn.execute(
+                "INSERT INTO clinics_fts (rowid, name, address, services, languages) VALUES (?, ?, ?, ?, ?)",
+                (position, (clinic.get('name') or '').lower(), (clinic.get('address') or '').lower(),
+                 '\n'.join(services), '\n'.join(languages)),
+            )
+
+            if lat is not None and lon is not None:
+                conn.execute("INSERT INTO clinics_rtree VALUES (?, ?, ?, ?, ?)",
+                             (position, lat, lat, lon, lon))
+                located += 1
+
+        meta = {
+            'version': STORE_VERSION,
+            'data_version': data_version,
+            'count': len(clinics),
+            'located': located,
+            'aggregates': compute_aggregates(clinics),
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [(key, json.dumps(value, ensure_ascii=False)) for key, value in meta.items()])
+        conn.execute("INSERT INTO clinics_fts (clinics_fts) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    tmp_path.replace(path)
+    return meta
+
+
+class ClinicStore:
+    """Read-only queries over a store file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        # immutable: the file is never written while deployed, so SQLite
+        # can skip locking and change detection
+        self.conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro&immutable=1",
+                                    uri=True, check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self.meta = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+        self.version: int = self.meta['version']
+        self.data_version: str = self.meta['data_version']
+        self.count: int = self.meta['count']
+        self.located: int = self.meta['located']
+        self.aggregates: Dict = self.meta['aggregates']
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clinics(self) -> "StoreClinics":
+        """Every clinic, in dataset order, each decoded on first access"""
+        return StoreClinics(self)
+
+    def text_matches_sql(self, search_text: str) -> Tuple[str, List[Any]]:
+        """
+        SQL selecting ids of clinics whose lowercased name, address, or a
+        service or language contains search_text
+        """
+        text = search_text.lower()
+        if len(text) >= TRIGRAM_SIZE:
+            phrase = '"' + text.replace('"', '""') + '"'
+            return "SELECT rowid FROM clinics_fts WHERE clinics_fts MATCH ?", [phrase]
+        return ("SELECT rowid FROM clinics_fts WHERE instr(name, ?) OR instr(address, ?)"
+                " OR instr(services, ?) OR instr(languages, ?)", [text] * 4)
+
+    def candidates(self, search_text: Optional[str], services: List[str],
+                   languages: List[str], min_score: Optional[int],
+                   facets: Optional[Dict[str, Optional[bool]]] = None) -> List[int]:
+        """Same contract as ClinicIndex.candidates, answered by one query"""
+        clauses = []
+        params: List[Any] = []
+        for field, wanted in (facets or {}).items():
+            if wanted is None:
+                continue
+            if field not in FACET_FIELDS:
+                raise ValueError(f"Unknown facet {field}")
+            clauses.append(f"{field} = ?")
+            params.append(1 if wanted else 0)
+
+        if search_text:
+            sql, text_params = self.text_matches_sql(search_text)
+            clauses.append(f"id IN ({sql})")
+            params.extend(text_params)
+        elif min_score and min_score > 0 and (services or languages):
+            # Without a text query a clinic matching none of the selected
+            # services or languages scores 0 and is filtered out anyway
+            selects = []
+            for table, link, column, selected in (
+                    ('services', 'clinic_services', 'service_id', services),
+                    ('languages', 'clinic_languages', 'language_id', languages)):
+                if selected:
+                    selects.append(f"SELECT clinic_id FROM {link} JOIN {table} ON {table}.id = {column}"
+                                   f" WHERE {table}.name IN ({', '.join('?' * len(selected))})")
+                    params.extend(value.lower() for value in selected)
+            clauses.append(f"id IN ({' UNION '.join(selects)})")
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return [i for i, in self.conn.execute(f"SELECT id FROM clinics{where} ORDER BY id", params)]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        """(distance_km, id) for clinics within radius_km, nearest first"""
+        south, west, north, east = bounding_box(lat, lon, radius_km)
+        # The R*Tree stores 32-bit floats, so the exact coordinates come
+        # from the clinics table
+        rows = self.conn.execute(
+            "SELECT c.id, c.lat, c.lon FROM clinics_rtree r JOIN clinics c ON c.id = r.id"
+            " WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+            (south, north, west, east),
+        ).fetchall()
+        distances = batch_distances([row[1] for row in rows], [row[2] for row in rows],
+                                    lat, lon, radius_km)
+        found = [(distance, row[0]) for distance, row in zip(distances, rows) if distance is not None]
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[float, int]]:
+        """(distance_km, id) for the k nearest located clinics, nearest first"""
+        if k <= 0 or not self.located:
+            return []
+        wanted = min(k, self.located)
+        radius_km = NEAREST_START_KM
+        while True:
+            # Everything inside the circle is found, so its k nearest are
+            # the k nearest overall
+            found = self.within(lat, lon, radius_km)
+            if len(found) >= wanted or radius_km > pi * EARTH_RADIUS_KM:
+                return found[:k]
+            radius_km *= 2
+
+    def clinic_rows(self, ids: List[int]) -> Dict[int, Dict]:
+        """Clinics by id"""
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for i, data in self.conn.execute(
+                    f"SELECT id, data FROM clinics WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                rows[i] = json.loads(data)
+        return rows
+
+    def spatial_index(self, make_item: Callable[[int, Dict], Any]) -> "StoreSpatialIndex":
+        """GridIndex-compatible view whose items are make_item(id, clinic)"""
+        return StoreSpatialIndex(self, make_item)
+
+
+class StoreSpatialIndex:
+    """within/nearest over a ClinicStore's R*Tree, with GridIndex's interface"""
+
+    def __init__(self, store: ClinicStore, make_item: Callable[[int, Dict], Any]):
+        self.store = store
+        self.make_item = make_item
+        self._items: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return self.store.located
+
+    def _with_items(self, found: List[Tuple[float, int]]) -> List[Tuple[float, Any]]:
+        missing = [i for _, i in found if i not in self._items]
+        if missing:
+            for i, clinic in self.store.clinic_rows(missing).items():
+                self._items[i] = self.make_item(i, clinic)
+        return [(distance, self._items[i]) for distance, i in found]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Any]]:
+        """(distance_km, item) for clinics within radius_km, nearest first"""
+        return self._with_items(self.store.within(lat, lon, radius_km))
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[float, Any]]:
+        """(distance_km, item) for the k nearest clinics, nearest first"""
+        return self._with_items(self.store.nearest(lat, lon, k))
+
+
+class StoreClinics:
+    """
+    Read-only list of a store's clinics, each JSON-decoded on first access,
+    so opening the store doesn't parse every row
+    """
+
+    def __init__(self, store: ClinicStore):
+        self.store = store
+        self._clinics: List[Optional[Dict]] = [None] * store.count
+
+    def __len__(self) -> int:
+        return len(self._clinics)
+
+    def _load(self, positions: List[int]):
+        missing = [i for i in positions if self._clinics[i] is None]
+        if missing:
+            for i, clinic in self.store.clinic_rows(missing).items():
+                self._clinics[i] = clinic
+
+    def __getitem__(self, key):
+        positions = range(len(self._clinics))[key]
+        if isinstance(key, slice):
+            self._load(list(positions))
+            return [self._clinics[i] for i in positions]
+        self._load([positions])
+        return self._clinics[positions]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class LazyRecords:
+    """ClinicRecords compiled on first access, indexed by position"""
+
+    def __init__(self, clinics: Sequence[Dict]):
+        self.clinics = clinics
+        self._records: List[Optional[ClinicRecord]] = [None] * len(clinics)
+
+    def __len__(self) -> int:
+        return len(self.clinics)
+
+    def __getitem__(self, position: int) -> ClinicRecord:
+        record = self._records[position]
+        if record is None:
+            record = self._records[position] = compile_record(self.clinics[position], position)
+        return record
+
+
+class StoreIndex:
+    """
+    ClinicIndex interface (clinics, records, aggregates, candidates)
+    backed by a ClinicStore: candidates come from SQL and records are only
+    compiled for the clinics a search visits
+    """
+
+    def __init__(self, store: ClinicStore, clinics: Sequence[Dict]):
+        self.store = store
+        self.clinics = clinics
+        self.size = len(clinics)
+        self.records = LazyRecords(clinics)
+        self.aggregates = store.aggregates
+
+    def candidates(self, search_text: Optional[str], services: List[str],
+                   languages: List[str], min_score: Optional[int],
+                   facets: Optional[Dict[str, Optional[bool]]] = None) -> List[int]:
+        return self.store.candidates(search_text, services, languages, min_score, facets)
+
+
+def open_store(path: Path) -> Optional[ClinicStore]:
+    """
+    Open the store at path
+
+    Returns None if the file is missing, from another schema version or
+    unreadable (e.g. SQLite built without FTS5 or R*Tree).
+    """
+    if not path.exists():
+        return None
+    try:
+        store = ClinicStore(path)
+    except Exception as e:
+        logger.error(f"Error opening clinic store {path}: {e}")
+        return None
+    if store.version != STORE_VERSION:
+        logger.warning(f"Ignoring clinic store {path}: unsupported version {store.version}")
+        store.conn.close()
+        return None
+    return store
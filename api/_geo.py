@@ -0,0 +1,132 @@
+"""
+Geographic helpers for the live search APIs
+Haversine distances (single and batched) and slippy-map (web mercator)
+tiles used to cache Overpass results per fixed area instead of per
+exact query
+"""
+
+from math import asin, atan, cos, degrees, floor, log, pi, radians, sin, sinh, sqrt, tan
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# NumPy is optional: batch_distances falls back to a Python loop
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371
+
+# Below this many points the NumPy call overhead outweighs the loop
+NUMPY_MIN_POINTS = 32
+
+# Zoom 13 tiles are roughly 3 x 3 km around London
+TILE_ZOOM = 13
+
+# Web mercator only reaches this latitude (tiles are square up to it)
+MAX_MERCATOR_LAT = 85.0511
+
+Tile = Tuple[int, int]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in km"""
+    lat1, lon1, lat2, lon2 = radians(lat1), radians(lon1), radians(lat2), radians(lon2)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def batch_distances(lats: Sequence[Optional[float]], lons: Sequence[Optional[float]],
+                    lat0: float, lon0: float,
+                    radius_km: Optional[float] = None) -> List[Optional[float]]:
+    """
+    Haversine distance in km from (lat0, lon0) to every point
+
+    Points without coordinates get None. With radius_km, points outside
+    the radius also get None; points outside its bounding box are
+    rejected before any trig. The rest are computed in one NumPy pass
+    when available and there are enough of them.
+    """
+    if radius_km is not None:
+        south, west, north, east = bounding_box(lat0, lon0, radius_km)
+    else:
+        south, west, north, east = -90.0, -180.0, 90.0, 180.0
+
+    # The bounding box test is cheap and usually rejects most points
+    inside = [i for i, (lat, lon) in enumerate(zip(lats, lons))
+              if lat is not None and lon is not None and south <= lat <= north and west <= lon <= east]
+    result: List[Optional[float]] = [None] * len(lats)
+
+    if np is not None and len(inside) >= NUMPY_MIN_POINTS:
+        p1, l1 = np.radians(lat0), np.radians(lon0)
+        p2 = np.radians(np.array([lats[i] for i in inside], dtype=float))
+        l2 = np.radians(np.array([lons[i] for i in inside], dtype=float))
+        a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+        distances = (2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))).tolist()
+    else:
+        distances = [haversine_km(lat0, lon0, lats[i], lons[i]) for i in inside]
+
+    for i, distance in zip(inside, distances):
+        if radius_km is None or distance <= radius_km:
+            result[i] = distance
+    return result
+
+
+def element_coords(element: Dict) -> Tuple[Optional[float], Optional[float]]:
+    """Coordinates of an Overpass element (nodes, or ways queried with `out center`)"""
+    if element.get('lat') is not None:
+        return element.get('lat'), element.get('lon')
+    center = element.get('center') or {}
+    return center.get('lat'), center.get('lon')
+
+
+def tile_for(lat: float, lon: float, zoom: int = TILE_ZOOM) -> Tile:
+    """Slippy-map tile (x, y) containing a point (latitude clamped to the mercator range)"""
+    n = 2 ** zoom
+    x = int(floor((lon + 180.0) / 360.0 * n))
+    lat_r = radians(min(max(lat, -MAX_MERCATOR_LAT), MAX_MERCATOR_LAT))
+    y = int(floor((1.0 - log(tan(lat_r) + 1 / cos(lat_r)) / pi) / 2.0 * n))
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(tile: Tile, zoom: int = TILE_ZOOM) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile"""
+    x, y = tile
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = degrees(atan(sinh(pi * (1 - 2 * y / n))))
+    south = degrees(atan(sinh(pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) box enclosing a circle, latitudes within +-90"""
+    dlat = degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = degrees(radius_km / (EARTH_RADIUS_KM * max(cos(radians(lat)), 1e-6)))
+    return max(lat - dlat, -90.0), lon - dlon, min(lat + dlat, 90.0), lon + dlon
+
+
+def covering_tiles(lat: float, lon: float, radius_km: float, zoom: int = TILE_ZOOM,
+                   max_tiles: Optional[int] = None) -> List[Tile]:
+    """
+    Tiles intersecting the bounding box of a circle
+
+    Raises ValueError if there would be more than max_tiles, before
+    building the list.
+    """
+    south, west, north, east = bounding_box(lat, lon, radius_km)
+    x0, y0 = tile_for(north, west, zoom)
+    x1, y1 = tile_for(south, east, zoom)
+    count = (x1 - x0 + 1) * (y1 - y0 + 1)
+    if max_tiles is not None and count > max_tiles:
+        raise ValueError(f"{count} tiles cover the area, more than {max_tiles}")
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tiles_bounds(tiles: List[Tile], zoom: int = TILE_ZOOM) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of the rectangle spanned by tiles"""
+    xs = [x for x, _ in tiles]
+    ys = [y for _, y in tiles]
+    south, west, _, _ = tile_bounds((min(xs), max(ys)), zoom)
+    _, _, north, east = tile_bounds((max(xs), min(ys)), zoom)
+    return south, west, north, east
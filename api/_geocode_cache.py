@@ -0,0 +1,134 @@
+"""
+Persistent cache in front of Nominatim
+Results are kept in a SQLite file across restarts and runs. Empty results
+(unknown place) are cached too, for a shorter time, and concurrent misses
+for the same query share one upstream call. Nominatim allows 1 request/s,
+so every hit is also a throttle delay avoided.
+"""
+
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from _singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+POSITIVE_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 24 * 3600
+
+# Expired rows are deleted every this many writes
+PURGE_EVERY = 256
+
+
+def cache_key(*parts: Any) -> str:
+    """Normalized key for a query (case and whitespace insensitive)"""
+    return '|'.join(' '.join(str(part).lower().split()) for part in parts)
+
+
+class GeocodeCache:
+    """SQLite-backed TTL cache of JSON results"""
+
+    def __init__(self, path: Optional[Path], ttl: float = POSITIVE_TTL,
+                 negative_ttl: float = NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.conn = self._connect(path)
+
+    def _connect(self, path: Optional[Path]) -> sqlite3.Connection:
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                return self._open(str(path))
+            except (OSError, sqlite3.Error) as e:
+                # e.g. a read-only deployment: still cache for this process
+                logger.warning(f"Geocode cache {path} unavailable ({e}), caching in memory")
+        return self._open(':memory:')
+
+    @staticmethod
+    def _open(database: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(database, timeout=5.0, isolation_level=None, check_same_thread=False)
+        if database != ':memory:':
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS geocode "
+                     "(key TEXT PRIMARY KEY, value TEXT, expires REAL NOT NULL) WITHOUT ROWID")
+        return conn
+
+    def _read(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            row = self.conn.execute("SELECT value, expires FROM geocode WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return False, None
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(found, value) for key; value is None or empty for negative entries"""
+        found, value = self._read(key)
+        if not found:
+            self.misses += 1
+        elif value:
+            self.hits += 1
+        else:
+            self.negative_hits += 1
+        return found, value
+
+    def set(self, key: str, value: Any):
+        """Store a result; empty results expire after negative_ttl"""
+        now = time.time()
+        expires = now + (self.ttl if value else self.negative_ttl)
+        data = json.dumps(value) if value is not None else None
+        with self._lock:
+            self.conn.execute("INSERT INTO geocode (key, value, expires) VALUES (?, ?, ?) "
+                              "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                              (key, data, expires))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self.conn.execute("DELETE FROM geocode WHERE expires <= ?", (now,))
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Cached value for key, or await fetch() and store it
+
+        Concurrent misses for a key share one fetch. If fetch raises
+        (network error), nothing is cached.
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+
+        async def fetch_and_store():
+            # Another flight may have stored it while this one queued
+            found, value = self._read(key)
+            if not found:
+                value = await fetch()
+                self.set(key, value)
+            return value
+
+        return await self.flights.do(key, fetch_and_store)
+
+    def get_or_fetch_sync(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """get_or_fetch for synchronous callers (scripts)"""
+        found, value = self.get(key)
+        if found:
+            return value
+        value = fetch()
+        self.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,55 @@
+"""
+Shared async HTTP client for upstream APIs (Overpass, Google Places)
+One pooled httpx.AsyncClient per process, so live searches reuse
+keep-alive connections and never block the event loop
+"""
+
+from typing import Any, Awaitable, Optional
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by all upstreams
+POOL_LIMITS = httpx.Limits(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=30.0,
+)
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the process-wide client, creating it on first use"""
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT)
+    return _client
+
+
+async def close_client():
+    """Close the shared client (app shutdown)"""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def with_deadline(call: Awaitable, seconds: float, upstream: str, default: Any) -> Any:
+    """
+    Await an upstream call with an overall deadline
+
+    On timeout the call is cancelled and default is returned, so one slow
+    upstream can't hold up results from the others.
+    """
+    try:
+        return await asyncio.wait_for(call, timeout=seconds)
+    except asyncio.TimeoutError:
+        logger.warning(f"{upstream} timed out after {seconds}s")
+        return default
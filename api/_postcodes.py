@@ -0,0 +1,171 @@
+"""
+Offline UK postcode geocoder
+Centroids for full postcodes, sectors, districts and areas are packed into
+one sorted array of fixed-width keys with parallel coordinates, searched
+with binary search straight from an mmap
+
+File layout (scripts/build_postcode_index.py):
+    MAGIC (4 bytes) | version (uint16) | count (uint32) |
+    keys (count x KEY_WIDTH bytes, ASCII, space padded, sorted) |
+    coordinates (count x 2 int32, microdegrees lat/lon)
+
+Keys are normalized with a single space between outward and inward code,
+so every level is distinct: "NW6 7AB" (postcode), "NW6 7" (sector),
+"NW6" (district), "NW" (area). Central London subdistricts also count
+towards their district ("W1G" -> "W1").
+"""
+
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import mmap
+import re
+import struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DTPC'
+INDEX_VERSION = 1
+KEY_WIDTH = 8   # "EC1A 1BB"
+_HEADER = struct.Struct('<4sHI')
+_COORDS = struct.Struct('<ii')
+
+FULL_RE = re.compile(r'^([A-Z]{1,2}[0-9][A-Z0-9]?) ?([0-9])([A-Z]{2})$')
+SECTOR_RE = re.compile(r'^([A-Z]{1,2}[0-9][A-Z0-9]?) ([0-9])$')
+DISTRICT_RE = re.compile(r'^[A-Z]{1,2}[0-9][A-Z0-9]?$')
+AREA_RE = re.compile(r'^[A-Z]{1,2}$')
+AREA_PREFIX_RE = re.compile(r'^[A-Z]{1,2}')
+SUBDISTRICT_RE = re.compile(r'^[A-Z]{1,2}[0-9][A-Z]$')
+
+
+def outward_keys(outward: str) -> List[str]:
+    """District (and parent district of a subdistrict) and area keys"""
+    keys = [outward]
+    if SUBDISTRICT_RE.match(outward):
+        keys.append(outward[:-1])
+    keys.append(AREA_PREFIX_RE.match(outward).group(0))
+    return keys
+
+
+def postcode_keys(text: str, allow_area: bool = False) -> List[str]:
+    """
+    Index keys a query could resolve to, most specific first, e.g.
+    "nw6 7ab" -> ["NW6 7AB", "NW6 7", "NW6", "NW"]; [] if the text
+    isn't a (partial) postcode
+
+    A bare area ("NW") is only accepted with allow_area, for input known
+    to be a postcode: as free text, one or two letters ("e", "se") are
+    more likely a word than a postcode area.
+    """
+    compact = ' '.join(text.upper().split())
+    match = FULL_RE.match(compact)
+    if match:
+        outward, sector, unit = match.groups()
+        return [f"{outward} {sector}{unit}", f"{outward} {sector}"] + outward_keys(outward)
+    match = SECTOR_RE.match(compact)
+    if match:
+        outward, sector = match.groups()
+        return [f"{outward} {sector}"] + outward_keys(outward)
+    if DISTRICT_RE.match(compact):
+        return outward_keys(compact)
+    if allow_area and AREA_RE.match(compact):
+        return [compact]
+    return []
+
+
+def build_centroids(points: Iterable[Tuple[str, float, float]]) -> Dict[str, Tuple[float, float]]:
+    """
+    Centroids for every level from (postcode, lat, lon) points: full
+    postcodes keep their own mean, coarser levels average their postcodes
+    """
+    sums: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+    postcodes: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+    for postcode, lat, lon in points:
+        if not FULL_RE.match(' '.join(postcode.upper().split())):
+            continue
+        total = postcodes[postcode_keys(postcode)[0]]
+        total[0] += lat
+        total[1] += lon
+        total[2] += 1
+
+    for postcode, (lat_sum, lon_sum, n) in postcodes.items():
+        lat, lon = lat_sum / n, lon_sum / n
+        for key in postcode_keys(postcode)[1:]:
+            total = sums[key]
+            total[0] += lat
+            total[1] += lon
+            total[2] += 1
+        sums[postcode] = [lat, lon, 1]
+
+    return {key: (lat_sum / n, lon_sum / n) for key, (lat_sum, lon_sum, n) in sums.items()}
+
+
+def write_postcode_index(path: Path, centroids: Dict[str, Tuple[float, float]]) -> int:
+    """Pack centroids into an index file at path; returns the key count"""
+    keys = sorted(centroids)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, INDEX_VERSION, len(keys)))
+        f.write(b''.join(key.encode('ascii').ljust(KEY_WIDTH) for key in keys))
+        for key in keys:
+            lat, lon = centroids[key]
+            f.write(_COORDS.pack(round(lat * 1e6), round(lon * 1e6)))
+    tmp_path.replace(path)
+    return len(keys)
+
+
+class PostcodeIndex:
+    """Binary search over a packed index file"""
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != INDEX_VERSION:
+            self._mm.close()
+            raise ValueError(f"unsupported postcode index format in {path}")
+        self._keys_at = _HEADER.size
+        self._coords_at = self._keys_at + self.count * KEY_WIDTH
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, key: str) -> Optional[Tuple[float, float]]:
+        """Centroid for an exact (normalized) key"""
+        target = key.encode('ascii', 'replace').ljust(KEY_WIDTH)
+        if len(target) != KEY_WIDTH:
+            return None
+        mm = self._mm
+        base = self._keys_at
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * KEY_WIDTH
+            if mm[start:start + KEY_WIDTH] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or mm[base + lo * KEY_WIDTH:base + (lo + 1) * KEY_WIDTH] != target:
+            return None
+        lat, lon = _COORDS.unpack_from(mm, self._coords_at + lo * _COORDS.size)
+        return lat / 1e6, lon / 1e6
+
+    def geocode(self, text: str, allow_area: bool = False) -> Optional[Tuple[float, float]]:
+        """Centroid of the most specific known level of a (partial) postcode"""
+        for key in postcode_keys(text, allow_area):
+            coords = self.lookup(key)
+            if coords is not None:
+                return coords
+        return None
+
+
+def load_postcode_index(path: Path) -> Optional[PostcodeIndex]:
+    """The index at path, or None if it is missing or unreadable"""
+    if not path.exists():
+        return None
+    try:
+        return PostcodeIndex(path)
+    except Exception as e:
+        logger.error(f"Error loading postcode index {path}: {e}")
+        return None
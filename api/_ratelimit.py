@@ -0,0 +1,185 @@
+"""
+Rate limiting with GCRA (generic cell rate algorithm)
+Each key stores a single number, its theoretical arrival time (TAT): the
+time at which it would be back to a full burst. A limit of N requests per
+window allows a burst of N and then one request every window / N. Unlike
+a fixed window, the limit doesn't reset at a boundary, but a key that
+bursts N and keeps up the sustained rate still makes up to about 2N
+requests over one window's length.
+
+Backends store the TATs:
+- MemoryBackend: a dict in this process; no locks on the check path
+- SQLiteBackend: a table shared by every process using the same file;
+  checks may wait on other processes, so they are blocking calls
+A key whose TAT has passed is indistinguishable from an unseen key, so
+backends can evict it at any time.
+"""
+
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Idle keys are swept at most this often (seconds)
+SWEEP_INTERVAL = 60
+
+
+class RateLimit(NamedTuple):
+    requests: int    # burst size, and requests per window
+    window: float    # seconds
+
+    @property
+    def interval(self) -> float:
+        """Seconds between requests at the sustained rate"""
+        return self.window / self.requests
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int       # requests that would be allowed right now
+    retry_after: float   # seconds until the next request is allowed (0 if allowed)
+
+
+def gcra(tat: Optional[float], limit: RateLimit, now: float) -> Tuple[Decision, Optional[float]]:
+    """
+    One GCRA step for a key with theoretical arrival time tat (None if
+    unseen). Returns the decision and the new TAT to store, or None if
+    the request is refused and nothing changes.
+    """
+    interval = limit.interval
+    tat = max(tat or now, now)
+    new_tat = tat + interval
+    if new_tat - now > limit.window:
+        retry_after = new_tat - now - limit.window
+        return Decision(False, 0, retry_after), None
+    remaining = int((limit.window - (new_tat - now)) / interval + 1e-9)
+    return Decision(True, remaining, 0.0), new_tat
+
+
+class MemoryBackend:
+    """
+    TATs in a dict, for a single process
+
+    The check path is a dict lookup and store with no awaits or locks; on
+    the event loop that is atomic. Keys whose TAT has passed are swept
+    every SWEEP_INTERVAL, so memory is bounded by the keys active within
+    the longest window.
+    """
+
+    blocking = False
+
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._tats: Dict[str, float] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def _sweep(self, now: float):
+        expired = [key for key, tat in list(self._tats.items()) if tat <= now]
+        for key in expired:
+            self._tats.pop(key, None)
+        self.evictions += len(expired)
+        self._next_sweep = now + self.sweep_interval
+
+    def acquire(self, key: str, limit: RateLimit) -> Decision:
+        now = self.now()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        decision, tat = gcra(self._tats.get(key), limit, now)
+        if tat is not None:
+            self._tats[key] = tat
+        return decision
+
+
+class SQLiteBackend:
+    """
+    TATs in a SQLite table, shared between processes (e.g. several
+    workers on one host). Each check is one short IMMEDIATE transaction;
+    timestamps are wall-clock so every process agrees on them. A check
+    waits up to timeout seconds for another process's transaction.
+    """
+
+    blocking = True
+
+    def __init__(self, path: Path, sweep_interval: float = SWEEP_INTERVAL, timeout: float = 5.0):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), timeout=timeout, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rate_limits "
+                          "(key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+        self._next_sweep = 0.0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+    def now(self) -> float:
+        return time.time()
+
+    def _tat(self, key: str) -> Optional[float]:
+        row = self.conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def acquire(self, key: str, limit: RateLimit) -> Decision:
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.now()
+                decision, tat = gcra(self._tat(key), limit, now)
+                if tat is not None:
+                    self.conn.execute("INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                                      "ON CONFLICT (key) DO UPDATE SET tat = excluded.tat", (key, tat))
+                if now >= self._next_sweep:
+                    self.evictions += self.conn.execute(
+                        "DELETE FROM rate_limits WHERE tat <= ?", (now,)).rowcount
+                    self._next_sweep = now + self.sweep_interval
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return decision
+
+
+
+class RateLimiter:
+    """Per-tier GCRA limits over a backend"""
+
+    def __init__(self, limits: Dict[str, RateLimit], default_tier: str, backend=None):
+        self.limits = limits
+        self.default_tier = default_tier
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def limit_for(self, tier: str) -> RateLimit:
+        return self.limits.get(tier, self.limits[self.default_tier])
+
+    def check(self, key: str, tier: str) -> Decision:
+        """Count a request for key and decide whether it is allowed"""
+        return self.backend.acquire(key, self.limit_for(tier))
+
+    @property
+    def blocking(self) -> bool:
+        """Whether check() can block, so async callers should run it in a thread"""
+        return self.backend.blocking
+
+
+def make_backend(db_path: Optional[str] = None):
+    """SQLiteBackend for db_path if given, else MemoryBackend"""
+    if db_path:
+        logger.info(f"Rate limits shared through {db_path}")
+        return SQLiteBackend(Path(db_path))
+    return MemoryBackend()
@@ -0,0 +1,275 @@
+"""
+In-memory search index for the clinic dataset
+Built once when the data is loaded so /search can answer text, service
+and language queries from postings instead of scanning every clinic
+"""
+
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+import re
+
+# Length of the character n-grams indexed for name/address substring search
+NGRAM_SIZE = 3
+
+# Boolean clinic fields kept as bitmaps for facet filtering
+FACET_FIELDS = ('nhs', 'private', 'emergency', 'children', 'wheelchair_access', 'parking')
+
+# Outward code at the start of a UK postcode (e.g. "NW6" in "NW6 7AB")
+OUTWARD_CODE_RE = re.compile(r'^[A-Z]{1,2}[0-9][A-Z0-9]?')
+
+# Set bit positions for every byte value, used to unpack bitmaps
+_BYTE_POSITIONS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def ngrams(text: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """Return the set of character n-grams in text"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def bit_positions(mask: int) -> List[int]:
+    """Positions of the set bits in mask, ascending"""
+    positions = []
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            positions.extend(base + bit for bit in _BYTE_POSITIONS[byte])
+    return positions
+
+
+def compute_aggregates(clinics: List[Dict]) -> Dict:
+    """Dataset-wide counts behind /statistics, /services and /languages"""
+    service_counts = {}
+    language_counts = {}
+    total_services_count = 0
+
+    for clinic in clinics:
+        services = clinic.get('services') or []
+        for service in services:
+            service_counts[service] = service_counts.get(service, 0) + 1
+        for language in clinic.get('languages') or []:
+            language_counts[language] = language_counts.get(language, 0) + 1
+        total_services_count += len(services)
+
+    avg_services = total_services_count / len(clinics) if clinics else 0
+
+    return {
+        'total_clinics': len(clinics),
+        'total_services': len(service_counts),
+        'total_languages': len(language_counts),
+        'avg_services_per_clinic': round(avg_services, 1),
+        'service_counts': service_counts,
+        'language_counts': language_counts,
+        'services': sorted(service_counts),
+        'languages': sorted(language_counts),
+    }
+
+
+class ClinicRecord(NamedTuple):
+    """Normalized, read-only view of a clinic, precomputed for searching"""
+    position: int
+    clinic: Dict
+    name: str                       # lowercased
+    address: str                    # lowercased
+    address_upper: str
+    area: str                       # lowercased
+    postcode: str                   # uppercased
+    outward_code: str               # e.g. "NW6", '' when unknown
+    services: Tuple[str, ...]       # lowercased, data order
+    service_set: FrozenSet[str]
+    languages: Tuple[str, ...]      # lowercased, data order
+    language_set: FrozenSet[str]
+    service_count: int
+    rating: Optional[float]
+
+
+def outward_code(postcode: str) -> str:
+    """Outward code of a UK postcode, or '' if it doesn't look like one"""
+    compact = postcode.upper().replace(' ', '')
+    if len(compact) > 4:
+        # Full postcode: the inward code is always the last 3 characters
+        compact = compact[:-3]
+    match = OUTWARD_CODE_RE.match(compact)
+    return match.group(0) if match else ''
+
+
+def compile_record(clinic: Dict, position: int) -> ClinicRecord:
+    """Build the search record for one clinic"""
+    address = clinic.get('address') or ''
+    postcode = clinic.get('postcode') or ''
+    services = tuple(s.lower() for s in clinic.get('services') or [])
+    languages = tuple(l.lower() for l in clinic.get('languages') or [])
+    return ClinicRecord(
+        position=position,
+        clinic=clinic,
+        name=(clinic.get('name') or '').lower(),
+        address=address.lower(),
+        address_upper=address.upper(),
+        area=(clinic.get('area') or '').lower(),
+        postcode=postcode.upper(),
+        outward_code=outward_code(postcode),
+        services=services,
+        service_set=frozenset(services),
+        languages=languages,
+        language_set=frozenset(languages),
+        service_count=len(clinic.get('services') or []),
+        rating=clinic.get('rating'),
+    )
+
+
+class ClinicIndex:
+    """
+    Postings over a fixed list of clinics
+
+    - name/address: n-gram postings (substring search) and whitespace
+      token postings (short queries)
+    - services/languages: exact postings keyed by the lowercased value
+    - boolean facets: one bitmap of True values and one of known
+      (True/False) values per field, packed into Python ints
+    - aggregates: dataset-wide service/language counts
+
+    Postings hold positions in the clinic list (and in `records`), so
+    results can be returned in the original data order.
+    """
+
+    def __init__(self, clinics: List[Dict]):
+        self.clinics = clinics
+        self.size = len(clinics)
+        self.records: List[ClinicRecord] = [
+            compile_record(clinic, i) for i, clinic in enumerate(clinics)
+        ]
+        self.all_mask = (1 << self.size) - 1
+        self.facet_true: Dict[str, int] = {}
+        self.facet_known: Dict[str, int] = {}
+        self.aggregates = compute_aggregates(clinics)
+
+        ngram_postings = defaultdict(set)
+        token_postings = defaultdict(set)
+        service_postings = defaultdict(set)
+        language_postings = defaultdict(set)
+
+        for i, record in enumerate(self.records):
+            for text in (record.name, record.address):
+                for gram in ngrams(text):
+                    ngram_postings[gram].add(i)
+                for token in text.split():
+                    token_postings[token].add(i)
+
+            for service in record.service_set:
+                service_postings[service].add(i)
+            for language in record.language_set:
+                language_postings[language].add(i)
+
+        self.ngram_postings: Dict[str, Set[int]] = dict(ngram_postings)
+        self.token_postings: Dict[str, Set[int]] = dict(token_postings)
+        self.service_postings: Dict[str, Set[int]] = dict(service_postings)
+        self.language_postings: Dict[str, Set[int]] = dict(language_postings)
+
+        nbytes = (self.size + 7) // 8
+        for field in FACET_FIELDS:
+            true_bits = bytearray(nbytes)
+            known_bits = bytearray(nbytes)
+            for i, clinic in enumerate(clinics):
+                value = clinic.get(field)
+                if value == True:
+                    true_bits[i >> 3] |= 1 << (i & 7)
+                    known_bits[i >> 3] |= 1 << (i & 7)
+                elif value == False:
+                    known_bits[i >> 3] |= 1 << (i & 7)
+            self.facet_true[field] = int.from_bytes(true_bits, 'little')
+            self.facet_known[field] = int.from_bytes(known_bits, 'little')
+
+    def facet_mask(self, facets: Dict[str, Optional[bool]]) -> int:
+        """
+        Bitmap of clinics whose field equals the requested value for every
+        facet; None means the facet is not filtered, unknown values never match
+        """
+        mask = self.all_mask
+        for field, wanted in facets.items():
+            if wanted is None:
+                continue
+            if wanted:
+                mask &= self.facet_true[field]
+            else:
+                mask &= self.facet_known[field] & ~self.facet_true[field]
+            if not mask:
+                break
+        return mask
+
+    def _name_address_matches(self, text: str) -> Set[int]:
+        """Clinics whose lowercased name or address contains text"""
+        if len(text) >= NGRAM_SIZE:
+            # Every n-gram of the query must appear in the same field, so
+            # intersect postings (smallest first) and verify the survivors
+            postings = []
+            for gram in ngrams(text):
+                posting = self.ngram_postings.get(gram)
+                if not posting:
+                    return set()
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    return candidates
+            records = self.records
+            return {i for i in candidates
+                    if text in records[i].name or text in records[i].address}
+
+        if not any(ch.isspace() for ch in text):
+            # A short query without whitespace can only occur inside a token
+            matches = set()
+            for token, posting in self.token_postings.items():
+                if text in token:
+                    matches |= posting
+            return matches
+
+        return {r.position for r in self.records
+                if text in r.name or text in r.address}
+
+    def text_matches(self, search_text: str) -> Set[int]:
+        """Clinics matching search_text in name, address, services or languages"""
+        text = search_text.lower()
+        matches = self._name_address_matches(text)
+        for postings in (self.service_postings, self.language_postings):
+            for value, posting in postings.items():
+                if text in value:
+                    matches |= posting
+        return matches
+
+    def field_matches(self, field: str, selected: List[str]) -> Set[int]:
+        """Clinics having at least one of the selected services or languages"""
+        postings = self.service_postings if field == 'services' else self.language_postings
+        matches = set()
+        for value in selected:
+            matches |= postings.get(value.lower(), set())
+        return matches
+
+    def candidates(self, search_text: Optional[str], services: List[str],
+                   languages: List[str], min_score: Optional[int],
+                   facets: Optional[Dict[str, Optional[bool]]] = None) -> List[int]:
+        """
+        Positions of clinics that pass the facet filters and can pass the
+        text filter and min_score, in original data order
+        """
+        mask = self.facet_mask(facets or {})
+        if not mask:
+            return []
+
+        matches = None
+        if search_text:
+            matches = self.text_matches(search_text)
+        elif min_score and min_score > 0 and (services or languages):
+            # Without a text query a clinic matching none of the selected
+            # services or languages scores 0 and is filtered out anyway
+            matches = (self.field_matches('services', services)
+                       | self.field_matches('languages', languages))
+
+        if matches is None:
+            return bit_positions(mask)
+        if mask == self.all_mask:
+            return sorted(matches)
+        if len(matches) < self.size // 8:
+            return sorted(i for i in matches if mask >> i & 1)
+        return sorted(matches.intersection(bit_positions(mask)))
@@ -0,0 +1,44 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one in-flight upstream
+fetch instead of each starting their own
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+
+
+class SingleFlight:
+    """Deduplicate concurrent async calls by key"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.originating = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fetch() for key, or join the call already running for it
+
+        The fetch runs as its own task and callers await it through
+        asyncio.shield, so a caller going away (e.g. client disconnect)
+        doesn't cancel the fetch for everyone else. Errors are raised to
+        every caller of that flight.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.originating += 1
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            "originating": self.originating,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
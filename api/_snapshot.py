@@ -0,0 +1,121 @@
+"""
+Precompiled binary snapshot of the clinic dataset
+Holds the clinics, the search index and derived data so a cold serverless
+instance can skip JSON parsing and index building
+
+File layout:
+    MAGIC (6 bytes) | version (uint16) | header length (uint32) |
+    header (JSON)   | payload (pickle protocol 5)
+
+The header records the data version (content hash of the source JSON)
+and the index schema (hash of the _search_index code the payload was
+pickled with). read_snapshot checks both before unpickling, so a
+snapshot is never served after the JSON or the index classes change.
+Snapshots are only ever produced by scripts/build_snapshot.py from our
+own data.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+import gc
+import hashlib
+import json
+import logging
+import mmap
+import pickle
+import struct
+
+import _search_index
+from _search_index import ClinicIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DTSNAP'
+SNAPSHOT_VERSION = 3
+_PREFIX = struct.Struct('<6sHI')
+
+
+def data_version(raw: bytes) -> str:
+    """Content hash identifying a dataset"""
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def index_schema() -> str:
+    """Hash of the search index code, which pickled indexes depend on"""
+    return data_version(Path(_search_index.__file__).read_bytes())
+
+
+def build_payload(clinics: List[Dict]) -> Dict:
+    """Derived structures (index, aggregates) stored alongside the clinics"""
+    return {
+        'clinics': clinics,
+        'index': ClinicIndex(clinics),
+    }
+
+
+def write_snapshot(path: Path, source: Path) -> Dict:
+    """Compile the JSON dataset at source into a snapshot at path"""
+    raw = source.read_bytes()
+    clinics = json.loads(raw)
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'data_version': data_version(raw),
+        'source': source.name,
+        'index_schema': index_schema(),
+        'count': len(clinics),
+    }
+    header_bytes = json.dumps(header).encode()
+    payload = pickle.dumps(build_payload(clinics), protocol=5)
+
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    tmp_path.replace(path)
+    return header
+
+
+def read_snapshot(path: Path, expected_version: Optional[str] = None) -> Optional[Dict]:
+    """
+    Load a snapshot via mmap
+
+    Returns the payload dict with the header under 'header', or None if
+    the file is missing, from another format version, built with other
+    index code, built from other data than expected_version (when given)
+    or unreadable.
+    """
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+            if magic != MAGIC or version != SNAPSHOT_VERSION:
+                logger.warning(f"Ignoring snapshot {path}: unsupported format")
+                return None
+            start = _PREFIX.size
+            header = json.loads(mm[start:start + header_len])
+            if header.get('index_schema') != index_schema():
+                logger.warning(f"Ignoring snapshot {path}: built with other search index code")
+                return None
+            if expected_version is not None and header.get('data_version') != expected_version:
+                logger.warning(f"Ignoring stale snapshot {path}: {header.get('source')} has changed "
+                               f"since it was built, rerun scripts/build_snapshot.py")
+                return None
+            # The payload is a large number of small objects and none
+            # of them are garbage; skip GC passes while they are created
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                with memoryview(mm)[start + header_len:] as view:
+                    payload = pickle.loads(view)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except Exception as e:
+        logger.error(f"Error reading snapshot {path}: {e}")
+        return None
+
+    payload['header'] = header
+    return payload
@@ -0,0 +1,119 @@
+"""
+Uniform grid spatial index over clinic coordinates
+Points are projected to km on an equirectangular plane around the data's
+mean latitude and bucketed into square cells, so radius and k-nearest
+queries only look at nearby cells
+"""
+
+from math import ceil, cos, floor, radians
+from typing import Any, Dict, List, Sequence, Tuple
+
+from _geo import haversine_km
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON_EQUATOR = 111.320
+
+# Projection error at city scale is well under this; cells within the
+# margin are searched too and exact haversine decides
+PROJECTION_SLACK = 1.05
+
+
+class GridIndex:
+    """Static grid index answering radius and k-nearest queries in km"""
+
+    def __init__(self, points: Sequence[Tuple[float, float, Any]], cell_km: float = 1.0):
+        self.cell_km = cell_km
+        self.lats: List[float] = [p[0] for p in points]
+        self.lons: List[float] = [p[1] for p in points]
+        self.items: List[Any] = [p[2] for p in points]
+
+        ref_lat = sum(self.lats) / len(self.lats) if points else 51.5
+        self.km_per_lon = KM_PER_DEGREE_LON_EQUATOR * cos(radians(ref_lat))
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i in range(len(self.items)):
+            self.cells.setdefault(self._cell(self.lats[i], self.lons[i]), []).append(i)
+
+        xs = [c[0] for c in self.cells] or [0]
+        ys = [c[1] for c in self.cells] or [0]
+        self._extent = (min(xs), min(ys), max(xs), max(ys))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        x = lon * self.km_per_lon
+        y = lat * KM_PER_DEGREE_LAT
+        return int(floor(x / self.cell_km)), int(floor(y / self.cell_km))
+
+    def _max_ring(self, center: Tuple[int, int]) -> int:
+        """Ring beyond which no cell holds points"""
+        min_x, min_y, max_x, max_y = self._extent
+        cx, cy = center
+        return max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+
+    def _scan(self, lat: float, lon: float) -> List[Tuple[float, int]]:
+        """(distance_km, id) for every point"""
+        return [(haversine_km(lat, lon, self.lats[i], self.lons[i]), i)
+                for i in range(len(self.items))]
+
+    def _cheaper_to_scan(self, rings: int) -> bool:
+        """Whether visiting rings of cells costs more than a full scan"""
+        return (2 * rings + 1) ** 2 > 4 * len(self.items)
+
+    def _ring(self, center: Tuple[int, int], r: int) -> List[int]:
+        """Point ids in the square ring of cells at Chebyshev distance r"""
+        cx, cy = center
+        if r == 0:
+            return list(self.cells.get(center, ()))
+        ids = []
+        for dx in range(-r, r + 1):
+            for dy in (-r, r):
+                ids.extend(self.cells.get((cx + dx, cy + dy), ()))
+        for dy in range(-r + 1, r):
+            for dx in (-r, r):
+                ids.extend(self.cells.get((cx + dx, cy + dy), ()))
+        return ids
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Any]]:
+        """(distance_km, item) for points within radius_km, nearest first"""
+        center = self._cell(lat, lon)
+        rings = min(int(ceil(radius_km * PROJECTION_SLACK / self.cell_km)), self._max_ring(center))
+        if self._cheaper_to_scan(rings):
+            found = [(d, i) for d, i in self._scan(lat, lon) if d <= radius_km]
+        else:
+            found = []
+            for r in range(rings + 1):
+                for i in self._ring(center, r):
+                    distance = haversine_km(lat, lon, self.lats[i], self.lons[i])
+                    if distance <= radius_km:
+                        found.append((distance, i))
+        found.sort()
+        return [(distance, self.items[i]) for distance, i in found]
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[float, Any]]:
+        """(distance_km, item) for the k nearest points, nearest first"""
+        if k <= 0:
+            return []
+        center = self._cell(lat, lon)
+        max_ring = self._max_ring(center)
+        min_x, min_y, max_x, max_y = self._extent
+        cx, cy = center
+        empty_rings = max(0, min_x - cx, cx - max_x, min_y - cy, cy - max_y)
+        if self._cheaper_to_scan(empty_rings):
+            # Query far outside the data: the first rings would all be empty
+            candidates = self._scan(lat, lon)
+            candidates.sort()
+            return [(distance, self.items[i]) for distance, i in candidates[:k]]
+
+        candidates = []
+        for r in range(max_ring + 1):
+            for i in self._ring(center, r):
+                candidates.append((haversine_km(lat, lon, self.lats[i], self.lons[i]), i))
+            # Every unvisited point is at least r cells away
+            if len(candidates) >= k:
+                candidates.sort()
+                if candidates[k - 1][0] <= r * self.cell_km / PROJECTION_SLACK:
+                    break
+        candidates.sort()
+        return [(distance, self.items[i]) for distance, i in candidates[:k]]
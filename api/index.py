@@ -3,16 +3,25 @@ FastAPI backend for Dental Clinic Search - Vercel Serverless Version
 Adapted to work with Vercel's serverless functions
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+import base64
+import hashlib
+import heapq
 import json
 import os
+import sys
 from pathlib import Path
 from datetime import datetime
 import logging
 
+sys.path.insert(0, str(Path(__file__).parent))
+from _clinic_store import StoreIndex, open_store
+from _search_index import ClinicIndex, ClinicRecord
+from _snapshot import data_version, read_snapshot
+
 logger = logging.getLogger(__name__)
 
 # FastAPI app - routes are defined without /api prefix
@@ -26,6 +35,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let clients read listed response headers; pagination
+    # needs the next-page cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Data file paths - Vercel serverless functions can read from project files
@@ -42,9 +54,33 @@ if not JSON_FILE.exists():
 if not METADATA_FILE.exists():
     METADATA_FILE = Path(__file__).parent / "metadata.json"
 
+# SQLite clinic store built by scripts/combine_all_data.py, preferred over
+# the precompiled snapshot (scripts/build_snapshot.py), preferred over JSON
+STORE_FILE = Path(os.getenv('CLINICS_STORE_FILE', DATA_DIR / "data" / "clinics.db"))
+SNAPSHOT_FILE = Path(os.getenv('CLINICS_SNAPSHOT_FILE', DATA_DIR / "clinics.snapshot"))
+
+# JSON datasets tried in order when there is no store; the combined dataset
+# is what the store and snapshot are built from by default
+JSON_PATHS = [
+    DATA_DIR / "data" / "all_clinics_combined.json",
+    DATA_DIR / "private_dental_clinics_london.json",  # New private clinics
+    JSON_FILE,
+    DATA_DIR / "dental_clinics_london.json",
+    Path(__file__).parent / "dental_clinics_london.json",
+    Path(__file__).parent / "private_dental_clinics_london.json",
+]
+
+# Aggregate endpoints only change when the data does (i.e. on redeploy):
+# browsers revalidate with If-None-Match, Vercel's edge keeps them longer
+AGGREGATE_CACHE_CONTROL = "public, max-age=60, s-maxage=86400, stale-while-revalidate=3600"
+
 # Cache for loaded data (serverless functions can cache in memory)
 _data_cache = None
+_index_cache = None
+_data_version = None
 _metadata_cache = None
+# Serialized aggregate responses: name -> (data version, etag, body)
+_response_cache = {}
 
 
 class ClinicResponse(BaseModel):
@@ -83,6 +119,8 @@ class SearchRequest(BaseModel):
     min_score: Optional[int] = 0
     sort_by: str = "match"
     limit: Optional[int] = None
+    offset: Optional[int] = 0
+    cursor: Optional[str] = None
 
 
 class MatchResult(BaseModel):
@@ -101,34 +139,60 @@ class StatisticsResponse(BaseModel):
     last_updated: Optional[str] = None
 
 
-def load_clinics() -> List[Dict]:
-    """Load clinics from JSON file with caching"""
-    global _data_cache
+def _set_data(clinics: Sequence[Dict], version: str,
+              index: Optional[Union[ClinicIndex, StoreIndex]] = None) -> Sequence[Dict]:
+    """Cache loaded clinics and build the search index once"""
+    global _data_cache, _index_cache, _data_version
+
+    _data_cache = clinics
+    _index_cache = index if index is not None else ClinicIndex(clinics)
+    _data_version = version
+    return _data_cache
+
+
+def read_json_source() -> Tuple[Optional[Path], Optional[bytes]]:
+    """Path and bytes of the first JSON dataset found, or the embedded data"""
+    for json_path in JSON_PATHS:
+        if json_path.exists():
+            return json_path, json_path.read_bytes()
     
+    # Fallback: try environment variable (for embedded data)
+    if os.getenv('CLINICS_JSON_DATA'):
+        return None, os.getenv('CLINICS_JSON_DATA').encode()
+    return None, None
+
+
+def load_clinics() -> Sequence[Dict]:
+    """
+    Load clinics from the store, snapshot or JSON file with caching
+
+    Store clinics are decoded as they are first used, not on load.
+    """
     if _data_cache is not None:
         return _data_cache
     
+    store = open_store(STORE_FILE)
+    if store is not None:
+        clinics = store.clinics()
+        logger.info(f"Loaded {len(clinics)} clinics from {STORE_FILE}")
+        return _set_data(clinics, store.data_version, StoreIndex(store, clinics))
+    
     try:
-        # Try multiple paths - prioritize private clinics file
-        paths_to_try = [
-            Path(__file__).parent.parent / "private_dental_clinics_london.json",  # New private clinics
-            JSON_FILE,
-            Path(__file__).parent.parent / "dental_clinics_london.json",
-            Path(__file__).parent / "dental_clinics_london.json",
-            Path(__file__).parent / "private_dental_clinics_london.json",
-        ]
+        json_path, raw = read_json_source()
         
-        for json_path in paths_to_try:
-            if json_path.exists():
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    _data_cache = json.load(f)
-                    logger.info(f"Loaded {len(_data_cache)} clinics from {json_path}")
-                    return _data_cache
+        # The snapshot is only served if it was built from the same JSON
+        # that would be served without it
+        expected = data_version(raw) if raw is not None else None
+        snapshot = read_snapshot(SNAPSHOT_FILE, expected)
+        if snapshot is not None:
+            logger.info(f"Loaded {len(snapshot['clinics'])} clinics from {SNAPSHOT_FILE}")
+            return _set_data(snapshot['clinics'], snapshot['header']['data_version'],
+                             snapshot['index'])
         
-        # Fallback: try environment variable (for embedded data)
-        if os.getenv('CLINICS_JSON_DATA'):
-            _data_cache = json.loads(os.getenv('CLINICS_JSON_DATA'))
-            return _data_cache
+        if raw is not None:
+            clinics = json.loads(raw)
+            logger.info(f"Loaded {len(clinics)} clinics from {json_path or 'CLINICS_JSON_DATA'}")
+            return _set_data(clinics, expected)
         
         logger.warning("No JSON file found, returning empty list")
         return []
@@ -137,6 +201,24 @@ def load_clinics() -> List[Dict]:
         return []
 
 
+def load_index() -> Union[ClinicIndex, StoreIndex]:
+    """Get the search index for the loaded clinics"""
+    clinics = load_clinics()
+    if _index_cache is not None and _index_cache.clinics is clinics:
+        return _index_cache
+    # Data was not loaded through _set_data (e.g. no file found)
+    return ClinicIndex(clinics)
+
+
+def load_data_version() -> str:
+    """Content hash of the loaded dataset"""
+    clinics = load_clinics()
+    if _data_version is not None and _data_cache is clinics:
+        return _data_version
+    # Data was not loaded through _set_data (e.g. no file found)
+    return data_version(json.dumps(clinics, sort_keys=True).encode())
+
+
 def load_metadata() -> Dict:
     """Load metadata with caching"""
     global _metadata_cache
@@ -168,10 +250,25 @@ def load_metadata() -> Dict:
         return {}
 
 
-def calculate_match_score(clinic: Dict, search_text: Optional[str], 
-                         selected_services: List[str], 
-                         selected_languages: List[str]) -> Dict:
-    """Calculate match score for a clinic"""
+class MatchQuery(NamedTuple):
+    """Search terms normalized once per request for calculate_match_score"""
+    text: Optional[str]                     # lowercased search text
+    services: Tuple[Tuple[str, str], ...]   # (as requested, lowercased)
+    languages: Tuple[Tuple[str, str], ...]
+
+
+def compile_match_query(search_text: Optional[str], selected_services: List[str],
+                        selected_languages: List[str]) -> MatchQuery:
+    """Lowercase the search terms once, instead of once per clinic"""
+    return MatchQuery(
+        text=search_text.lower() if search_text else None,
+        services=tuple((s, s.lower()) for s in selected_services),
+        languages=tuple((l, l.lower()) for l in selected_languages),
+    )
+
+
+def calculate_match_score(record: ClinicRecord, query: MatchQuery) -> Dict:
+    """Calculate match score for a clinic from its precompiled record"""
     score = 0
     max_score = 100
     match_details = []
@@ -179,53 +276,42 @@ def calculate_match_score(clinic: Dict, search_text: Optional[str],
     matched_languages = []
 
     # Text search (30 points)
-    if search_text:
-        text = search_text.lower()
-        name_match = text in clinic.get('name', '').lower()
-        address_match = text in clinic.get('address', '').lower()
-        languages = [l.lower() for l in clinic.get('languages', [])]
-        language_match = any(text in lang for lang in languages)
-        services = [s.lower() for s in clinic.get('services', [])]
-        service_match = any(text in svc for svc in services)
-        
-        if name_match:
+    text = query.text
+    if text:
+        if text in record.name:
             score += 12
             match_details.append('Name matches')
-        if address_match:
+        if text in record.address:
             score += 8
             match_details.append('Address matches')
-        if language_match:
+        if any(text in lang for lang in record.languages):
             score += 5
             match_details.append('Language matches')
-        if service_match:
+        if any(text in svc for svc in record.services):
             score += 5
             match_details.append('Service matches')
     else:
         max_score -= 30
 
     # Services match (40 points)
-    if selected_services:
-        clinic_services = clinic.get('services', [])
-        matched_services = [s for s in selected_services 
-                          if any(cs.lower() == s.lower() for cs in clinic_services)]
-        service_score = (len(matched_services) / len(selected_services)) * 40
+    if query.services:
+        matched_services = [s for s, s_lower in query.services if s_lower in record.service_set]
+        service_score = (len(matched_services) / len(query.services)) * 40
         score += service_score
         
         if matched_services:
-            match_details.append(f"{len(matched_services)}/{len(selected_services)} services matched")
+            match_details.append(f"{len(matched_services)}/{len(query.services)} services matched")
     else:
         max_score -= 40
 
     # Languages match (30 points)
-    if selected_languages:
-        clinic_languages = clinic.get('languages', [])
-        matched_languages = [l for l in selected_languages 
-                           if any(cl.lower() == l.lower() for cl in clinic_languages)]
-        language_score = (len(matched_languages) / len(selected_languages)) * 30
+    if query.languages:
+        matched_languages = [l for l, l_lower in query.languages if l_lower in record.language_set]
+        language_score = (len(matched_languages) / len(query.languages)) * 30
         score += language_score
         
         if matched_languages:
-            match_details.append(f"{len(matched_languages)}/{len(selected_languages)} languages matched")
+            match_details.append(f"{len(matched_languages)}/{len(query.languages)} languages matched")
     else:
         max_score -= 30
 
@@ -240,6 +326,74 @@ def calculate_match_score(clinic: Dict, search_text: Optional[str],
     }
 
 
+# Fields of SearchRequest that only select a page, not the result set
+PAGINATION_FIELDS = {'limit', 'offset', 'cursor'}
+
+
+# Element types of result_sort_key's key for each sort mode
+_NUMBER = (int, float)
+SORT_KEY_TYPES = {
+    "match": (_NUMBER, int),
+    "name": (str, int),
+    "services": (_NUMBER, int),
+    "rating": (_NUMBER, int),
+}
+DEFAULT_SORT_KEY_TYPES = (int,)
+
+
+def result_sort_key(sort_by: str, record: ClinicRecord, score: int) -> tuple:
+    """
+    Ascending sort key for a search result
+
+    Ties are broken by position in the data, matching the stable sorts
+    used before, which also makes every key unique for cursors.
+    """
+    position = record.position
+    if sort_by == "match":
+        return (-score, position)
+    if sort_by == "name":
+        return (record.clinic.get('name') or '', position)
+    if sort_by == "services":
+        return (-record.service_count, position)
+    if sort_by == "rating":
+        return (-(record.rating or 0), position)
+    return (position,)
+
+
+def request_fingerprint(request: SearchRequest) -> str:
+    """Hash of the query part of a search request, used to bind cursors"""
+    query = request.model_dump(exclude=PAGINATION_FIELDS)
+    return hashlib.md5(json.dumps(query, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, key: tuple) -> str:
+    """Opaque token pointing just after the result with this sort key"""
+    payload = json.dumps([fingerprint, list(key)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, fingerprint: str, sort_by: str) -> tuple:
+    """
+    Sort key stored in a cursor, checked against the current request and
+    against the shape of result_sort_key's keys for sort_by, so it always
+    compares with them
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_fingerprint, key = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_fingerprint != fingerprint:
+        raise HTTPException(status_code=400, detail="Cursor does not match this search")
+    types = SORT_KEY_TYPES.get(sort_by, DEFAULT_SORT_KEY_TYPES)
+    # bool is an int subclass, but never part of a sort key
+    if (not isinstance(key, list) or len(key) != len(types)
+            or not all(isinstance(value, t) and not isinstance(value, bool)
+                       for value, t in zip(key, types))):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(key)
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -271,153 +425,163 @@ async def get_clinics(
     if limit:
         clinics = clinics[:limit]
     
-    return clinics
+    return list(clinics)
 
 
 @app.post("/search")
-async def search_clinics(request: SearchRequest):
-    """Search clinics with filters and match scoring"""
-    clinics = load_clinics()
+async def search_clinics(request: SearchRequest, response: Response):
+    """
+    Search clinics with filters and match scoring
+
+    When limit is set only the requested page is selected (heap top-k);
+    a limit of 0 or less returns every result, as before.
+    If more results follow, an opaque cursor for the next page is returned
+    in the X-Next-Cursor header; pass it back as `cursor` with the same
+    search to resume after the last result, without recomputing the
+    earlier pages. `offset` skips results after the cursor (or the start).
+    """
+    fingerprint = request_fingerprint(request)
+    after = decode_cursor(request.cursor, fingerprint, request.sort_by) if request.cursor else None
+    # Keys for these modes don't depend on the score, so earlier pages can
+    # be skipped before scoring
+    key_before_score = request.sort_by != "match"
+    
+    index = load_index()
+    
+    # Facet, text, service and language constraints come from the index;
+    # only the surviving candidates are visited below
+    candidates = index.candidates(
+        request.search_text,
+        request.services,
+        request.languages,
+        request.min_score,
+        facets={
+            'nhs': request.nhs,
+            'private': request.private,
+            'emergency': request.emergency,
+            'children': request.children,
+            'wheelchair_access': request.wheelchair,
+            'parking': request.parking,
+        }
+    )
+    
+    query = compile_match_query(request.search_text, request.services, request.languages)
+    area = request.area.lower() if request.area else None
+    postcode = request.postcode.upper() if request.postcode else None
+    records = index.records
     
     results = []
-    for clinic in clinics:
-        # Basic filters
-        if request.nhs is not None and clinic.get('nhs') != request.nhs:
-            continue
-        if request.private is not None and clinic.get('private') != request.private:
-            continue
-        if request.emergency is not None and clinic.get('emergency') != request.emergency:
-            continue
-        if request.children is not None and clinic.get('children') != request.children:
-            continue
-        if request.wheelchair is not None and clinic.get('wheelchair_access') != request.wheelchair:
-            continue
-        if request.parking is not None and clinic.get('parking') != request.parking:
-            continue
-        if request.min_rating and (not clinic.get('rating') or clinic.get('rating', 0) < request.min_rating):
+    for position in candidates:
+        record = records[position]
+        clinic = record.clinic
+        
+        # Basic filters (boolean facets already applied by the index bitmaps)
+        if request.min_rating and (not record.rating or record.rating < request.min_rating):
             continue
         
         # Area and postcode filters
-        if request.area:
-            area = clinic.get('area', '').lower()
-            address = clinic.get('address', '').lower()
-            if request.area.lower() not in area and request.area.lower() not in address:
-                continue
+        if area and area not in record.area and area not in record.address:
+            continue
         
-        if request.postcode:
-            postcode = clinic.get('postcode', '').upper()
-            address = clinic.get('address', '').upper()
-            if request.postcode.upper() not in postcode and request.postcode.upper() not in address:
-                continue
+        if postcode and postcode not in record.postcode and postcode not in record.address_upper:
+            continue
         
-        # Text search filter
-        if request.search_text:
-            search_lower = request.search_text.lower()
-            name_match = search_lower in clinic.get('name', '').lower()
-            address_match = search_lower in clinic.get('address', '').lower()
-            languages = [l.lower() for l in clinic.get('languages', [])]
-            language_match = any(search_lower in lang for lang in languages)
-            services = [s.lower() for s in clinic.get('services', [])]
-            service_match = any(search_lower in svc for svc in services)
-            
-            if not (name_match or address_match or language_match or service_match):
+        if after is not None and key_before_score:
+            if result_sort_key(request.sort_by, record, 0) <= after:
                 continue
         
-        # Calculate match score
-        match = calculate_match_score(
-            clinic, 
-            request.search_text, 
-            request.services, 
-            request.languages
-        )
+        # Calculate match score (text filter already applied by the index)
+        match = calculate_match_score(record, query)
         
         if match['score'] < request.min_score:
             continue
         
-        results.append({
+        key = result_sort_key(request.sort_by, record, match['score'])
+        if after is not None and not key_before_score and key <= after:
+            continue
+        
+        results.append((key, {
             "clinic": clinic,
             "match": match,
             "score": match['score']
-        })
+        }))
     
-    # Sort results
-    if request.sort_by == "match":
-        results.sort(key=lambda x: x['score'], reverse=True)
-    elif request.sort_by == "name":
-        results.sort(key=lambda x: x['clinic'].get('name', ''))
-    elif request.sort_by == "services":
-        results.sort(key=lambda x: len(x['clinic'].get('services', [])), reverse=True)
-    elif request.sort_by == "rating":
-        results.sort(key=lambda x: x['clinic'].get('rating', 0), reverse=True)
+    # Select the requested page; keys are unique so results never compare
+    offset = max(request.offset or 0, 0)
+    if request.limit and request.limit > 0:
+        end = offset + request.limit
+        page = heapq.nsmallest(end + 1, results, key=lambda x: x[0])
+        has_more = len(page) > end
+        page = page[offset:end]
+        if has_more and page:
+            response.headers["X-Next-Cursor"] = encode_cursor(fingerprint, page[-1][0])
+    else:
+        page = sorted(results, key=lambda x: x[0])[offset:]
     
-    if request.limit:
-        results = results[:request.limit]
+    return [result for _, result in page]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header covers etag"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+def cached_aggregate_response(request: Request, name: str, build) -> Response:
+    """
+    Serve an aggregate endpoint from its serialized body
+
+    The body is built once per data version. The strong ETag combines the
+    dataset hash with a hash of the body, so it changes whenever the data
+    (or metadata shown in the response) changes.
+    """
+    version = load_data_version()
+    entry = _response_cache.get(name)
+    if entry is None or entry[0] != version:
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = f'"{version}-{hashlib.md5(body).hexdigest()[:8]}"'
+        entry = (version, etag, body)
+        _response_cache[name] = entry
     
-    return results
+    _, etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": AGGREGATE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.get("/statistics")
-async def get_statistics():
+async def get_statistics(request: Request):
     """Get statistics about clinics, services, and languages"""
-    clinics = load_clinics()
-    metadata = load_metadata()
-    
-    all_services = set()
-    all_languages = set()
-    total_services_count = 0
-    
-    service_counts = {}
-    language_counts = {}
-    
-    for clinic in clinics:
-        services = clinic.get('services', [])
-        languages = clinic.get('languages', [])
-        
-        for service in services:
-            all_services.add(service)
-            service_counts[service] = service_counts.get(service, 0) + 1
-        
-        for language in languages:
-            all_languages.add(language)
-            language_counts[language] = language_counts.get(language, 0) + 1
-        
-        total_services_count += len(services)
-    
-    avg_services = total_services_count / len(clinics) if clinics else 0
+    def build():
+        aggregates = load_index().aggregates
+        return {
+            "total_clinics": aggregates['total_clinics'],
+            "total_services": aggregates['total_services'],
+            "total_languages": aggregates['total_languages'],
+            "avg_services_per_clinic": aggregates['avg_services_per_clinic'],
+            "service_counts": aggregates['service_counts'],
+            "language_counts": aggregates['language_counts'],
+            "last_updated": load_metadata().get('last_updated')
+        }
     
-    return {
-        "total_clinics": len(clinics),
-        "total_services": len(all_services),
-        "total_languages": len(all_languages),
-        "avg_services_per_clinic": round(avg_services, 1),
-        "service_counts": service_counts,
-        "language_counts": language_counts,
-        "last_updated": metadata.get('last_updated')
-    }
+    return cached_aggregate_response(request, "statistics", build)
 
 
 @app.get("/services")
-async def get_services():
+async def get_services(request: Request):
     """Get all unique services"""
-    clinics = load_clinics()
-    services = set()
-    
-    for clinic in clinics:
-        services.update(clinic.get('services', []))
-    
-    return sorted(list(services))
+    return cached_aggregate_response(request, "services", lambda: load_index().aggregates['services'])
 
 
 @app.get("/languages")
-async def get_languages():
+async def get_languages(request: Request):
     """Get all unique languages"""
-    clinics = load_clinics()
-    languages = set()
-    
-    for clinic in clinics:
-        languages.update(clinic.get('languages', []))
-    
-    return sorted(list(languages))
+    return cached_aggregate_response(request, "languages", lambda: load_index().aggregates['languages'])
 
 # Vercel serverless function handler
 # Mangum wraps FastAPI to work with Vercel's serverless environment
@@ -6,14 +6,24 @@ Queries real-time data from OpenStreetMap and optional Google Places
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional
-import requests
+from typing import List, Dict, Optional, Tuple, Union
+import asyncio
 import json
 import time
 import os
-from datetime import datetime, timedelta
+import sys
+from pathlib import Path
+from datetime import datetime
 import hashlib
 
+sys.path.insert(0, str(Path(__file__).parent))
+from _cache import MISS, TTLCache
+from _clinic_store import StoreSpatialIndex, open_store
+from _geo import (Tile, TILE_ZOOM, batch_distances, covering_tiles, element_coords,
+                  tile_for, tiles_bounds)
+from _http import close_client, get_client, with_deadline
+from _spatial import GridIndex
+
 app = FastAPI(title="Dental Clinic Live Search API", version="2.0.0")
 
 # CORS
@@ -25,13 +35,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Simple in-memory cache
-_cache = {}
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_client()
+
+
+# Bounded LRU/TTL caches; expired entries are served for up to CACHE_STALE_TTL
+# more while one background task refreshes them, and concurrent misses for
+# the same key share one upstream fetch
 CACHE_TTL = 300  # 5 minutes
+CACHE_STALE_TTL = 300
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Overpass results are cached per slippy-map tile (zoom TILE_ZOOM), so any
+# search is assembled from the tiles covering it
+TILE_CACHE_MAX_ENTRIES = 4096
+
+# Largest search radius (meters), and most tiles one search may cover:
+# each tile is a cache entry and, when missing, part of an Overpass query.
+# 25 km covers about 300 tiles around London; near the poles tiles shrink
+# and the tile cap applies first
+MAX_RADIUS_M = 25000
+MAX_AREA_TILES = 400
+_tile_cache = TTLCache(
+    ttl=CACHE_TTL,
+    stale_ttl=CACHE_STALE_TTL,
+    max_entries=TILE_CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+)
+
+# Google Places results are cached per exact search
+GOOGLE_CACHE_MAX_ENTRIES = 512
+_google_cache = TTLCache(
+    ttl=CACHE_TTL,
+    stale_ttl=CACHE_STALE_TTL,
+    max_entries=GOOGLE_CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES // 4,
+)
+
+# Offline dataset for /nearby and /nearest (combined OSM + scraped clinics):
+# the SQLite store's R*Tree, or a grid index over the JSON file without it
+LOCAL_STORE_FILE = Path(os.getenv('CLINICS_STORE_FILE', Path(__file__).parent.parent / "data" / "clinics.db"))
+LOCAL_DATA_FILE = Path(__file__).parent.parent / "data" / "all_clinics_combined.json"
+_local_index: Optional[Union[StoreSpatialIndex, GridIndex]] = None
 
 # API Keys (from environment)
 GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 
+# Upstream endpoints and per-upstream deadlines (seconds)
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+GOOGLE_PLACES_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+OVERPASS_TIMEOUT = 30
+GOOGLE_PLACES_TIMEOUT = 10
+
 
 class Clinic(BaseModel):
     id: str
@@ -65,59 +122,121 @@ def get_cache_key(query: str, lat: float, lon: float, radius: int) -> str:
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
-def get_cached(key: str) -> Optional[Dict]:
-    """Get from cache if not expired"""
-    if key in _cache:
-        entry = _cache[key]
-        if datetime.now() < entry['expires']:
-            return entry['data']
-        del _cache[key]
-    return None
-
-
-def set_cache(key: str, data: Dict):
-    """Store in cache"""
-    _cache[key] = {
-        'data': data,
-        'expires': datetime.now() + timedelta(seconds=CACHE_TTL)
-    }
-
-
-def search_overpass(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
+async def search_overpass(south: float, west: float, north: float, east: float) -> List[Dict]:
     """
-    Search for dentists using OpenStreetMap Overpass API
-    Real-time query - always returns fresh data
+    Search for dentists in a bounding box using OpenStreetMap Overpass API
+    Ways are returned with their center point. Raises on upstream errors
+    so a failed fetch is never cached as an empty area.
     """
+    bbox = f"{south},{west},{north},{east}"
     # Overpass QL query
     query = f"""
     [out:json][timeout:30];
     (
-      node["amenity"="dentist"](around:{radius_m},{lat},{lon});
-      way["amenity"="dentist"](around:{radius_m},{lat},{lon});
-      node["healthcare"="dentist"](around:{radius_m},{lat},{lon});
-      way["healthcare"="dentist"](around:{radius_m},{lat},{lon});
+      node["amenity"="dentist"]({bbox});
+      way["amenity"="dentist"]({bbox});
+      node["healthcare"="dentist"]({bbox});
+      way["healthcare"="dentist"]({bbox});
     );
-    out body;
-    >;
-    out skel qt;
+    out center;
     """
 
-    try:
-        response = requests.post(
-            "https://overpass-api.de/api/interpreter",
-            data={'data': query},
-            headers={'User-Agent': 'DentalTrawler/2.0'},
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get('elements', [])
-    except Exception as e:
-        print(f"Overpass API error: {e}")
-        return []
+    response = await get_client().post(
+        OVERPASS_URL,
+        data={'data': query},
+        headers={'User-Agent': 'DentalTrawler/2.0'},
+        timeout=OVERPASS_TIMEOUT
+    )
+    response.raise_for_status()
+    data = response.json()
+    # Query timeouts and memory errors come back as HTTP 200 with a remark
+    # and partial elements
+    remark = data.get('remark') or ''
+    if 'runtime error' in remark:
+        raise RuntimeError(f"Overpass {remark}")
+    return data.get('elements', [])
+
+
+def tile_key(tile: Tile) -> str:
+    return f"{TILE_ZOOM}/{tile[0]}/{tile[1]}"
+
 
+async def fetch_tiles(tiles: List[Tile]) -> Dict[Tile, List[Dict]]:
+    """
+    Fetch the rectangle spanning tiles with one Overpass query and cache
+    every tile inside it (including empty ones) as compact clinic rows
+    """
+    south, west, north, east = tiles_bounds(tiles)
+    elements = await search_overpass(south, west, north, east)
+
+    xs = [x for x, _ in tiles]
+    ys = [y for _, y in tiles]
+    by_tile = {(x, y): [] for x in range(min(xs), max(xs) + 1)
+               for y in range(min(ys), max(ys) + 1)}
+    for element in elements:
+        if element.get('type') not in ('node', 'way') or not element.get('tags'):
+            continue
+        row = osm_row(element)
+        if row is None or 'lat' not in row or 'lon' not in row:
+            continue
+        tile = tile_for(row['lat'], row['lon'])
+        if tile in by_tile:
+            by_tile[tile].append(row)
+
+    for tile, tile_rows in by_tile.items():
+        _tile_cache.set(tile_key(tile), tile_rows)
+    return by_tile
+
+
+async def get_area_rows(lat: float, lon: float, radius_km: float) -> Tuple[List[Dict], bool]:
+    """
+    Clinic rows in the tiles covering a circle (not yet distance
+    filtered), and whether they were all served from cache
 
-def search_google_places(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
+    Stale tiles are returned as-is and refreshed in the background; missing
+    tiles are fetched together in one query. Areas covering more than
+    MAX_AREA_TILES tiles are rejected with a 400.
+    """
+    try:
+        tiles = covering_tiles(lat, lon, radius_km, max_tiles=MAX_AREA_TILES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Search area too large: {e}")
+
+    rows = []
+    missing = []
+    stale = []
+    for tile in tiles:
+        found = _tile_cache.lookup(tile_key(tile))
+        if found is None:
+            missing.append(tile)
+            continue
+        tile_rows, is_fresh = found
+        rows.extend(tile_rows)
+        if not is_fresh:
+            stale.append(tile)
+
+    if stale:
+        batch = "tiles:" + ",".join(tile_key(t) for t in stale)
+        _tile_cache.spawn(batch, lambda: fetch_tiles(stale))
+
+    if missing:
+        batch = "tiles:" + ",".join(tile_key(t) for t in missing)
+        try:
+            fetched = await _tile_cache.flights.do(
+                batch,
+                lambda: with_deadline(fetch_tiles(missing), OVERPASS_TIMEOUT, "Overpass", None)
+            )
+        except Exception as e:
+            print(f"Overpass API error: {e}")
+            fetched = None
+        if fetched:
+            for tile in missing:
+                rows.extend(fetched.get(tile, []))
+
+    return rows, not missing
+
+
+async def search_google_places(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
     """
     Search using Google Places API (requires API key)
     Returns richer data with ratings and reviews
@@ -125,49 +244,58 @@ def search_google_places(lat: float, lon: float, radius_m: int = 5000) -> List[D
     if not GOOGLE_PLACES_API_KEY:
         return []
 
+    params = {
+        'location': f"{lat},{lon}",
+        'radius': radius_m,
+        'type': 'dentist',
+        'key': GOOGLE_PLACES_API_KEY
+    }
+    response = await get_client().get(GOOGLE_PLACES_URL, params=params, timeout=GOOGLE_PLACES_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    # Quota and key errors come back as HTTP 200 with an error status
+    if data.get('status', 'OK') not in ('OK', 'ZERO_RESULTS'):
+        raise RuntimeError(f"Google Places status {data['status']}")
+    return data.get('results', [])
+
+
+async def fetch_google_rows(lat: float, lon: float, radius_m: int) -> List[Dict]:
+    """Google Places results for a search as compact clinic rows; raises on errors"""
+    places = await asyncio.wait_for(search_google_places(lat, lon, radius_m), timeout=GOOGLE_PLACES_TIMEOUT)
+    return [google_row(place) for place in places]
+
+
+async def get_google_places(lat: float, lon: float, radius_m: int) -> Tuple[List[Dict], bool]:
+    """
+    Google Places rows for a search (cached), and whether they came from
+    cache; an upstream error or timeout gives no rows and isn't cached
+    """
+    cache_key = get_cache_key('', lat, lon, radius_m)
     try:
-        url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params = {
-            'location': f"{lat},{lon}",
-            'radius': radius_m,
-            'type': 'dentist',
-            'key': GOOGLE_PLACES_API_KEY
-        }
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('results', [])
+        rows, cache_state = await _google_cache.get_or_fetch(
+            cache_key,
+            lambda: fetch_google_rows(lat, lon, radius_m)
+        )
     except Exception as e:
-        print(f"Google Places API error: {e}")
-        return []
+        print(f"Google Places API error: {e!r}")
+        return [], False
+    return rows, cache_state != MISS
 
 
-def convert_osm_to_clinic(element: Dict, user_lat: float, user_lon: float) -> Optional[Clinic]:
-    """Convert OpenStreetMap element to Clinic model"""
+def compact(fields: Dict) -> Dict:
+    """Drop unset fields from a row; the model defaults them to None"""
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def osm_row(element: Dict) -> Optional[Dict]:
+    """Compact Clinic fields (without distance) for a named OpenStreetMap element"""
     tags = element.get('tags', {})
     name = tags.get('name')
 
     if not name:
         return None
 
-    lat = element.get('lat')
-    lon = element.get('lon')
-
-    # Calculate distance if coordinates available
-    distance = None
-    if lat and lon:
-        from math import radians, sin, cos, sqrt, atan2
-        R = 6371  # Earth radius in km
-
-        lat1, lon1 = radians(user_lat), radians(user_lon)
-        lat2, lon2 = radians(lat), radians(lon)
-
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = round(R * c, 2)
+    lat, lon = element_coords(element)
 
     # Build address
     address_parts = []
@@ -180,56 +308,151 @@ def convert_osm_to_clinic(element: Dict, user_lat: float, user_lon: float) -> Op
     if tags.get('addr:postcode'):
         address_parts.append(tags['addr:postcode'])
 
-    return Clinic(
-        id=f"osm_{element.get('id', '')}",
-        name=name,
-        address=', '.join(address_parts) if address_parts else None,
-        phone=tags.get('phone') or tags.get('contact:phone'),
-        website=tags.get('website') or tags.get('contact:website'),
-        email=tags.get('email') or tags.get('contact:email'),
-        postcode=tags.get('addr:postcode'),
-        area=tags.get('addr:city') or tags.get('addr:suburb'),
-        lat=lat,
-        lon=lon,
-        opening_hours=tags.get('opening_hours'),
-        source="OpenStreetMap",
-        distance_km=distance
-    )
+    return compact({
+        'id': f"osm_{element.get('id', '')}",
+        'name': name,
+        'address': ', '.join(address_parts) if address_parts else None,
+        'phone': tags.get('phone') or tags.get('contact:phone'),
+        'website': tags.get('website') or tags.get('contact:website'),
+        'email': tags.get('email') or tags.get('contact:email'),
+        'postcode': tags.get('addr:postcode'),
+        'area': tags.get('addr:city') or tags.get('addr:suburb'),
+        'lat': lat,
+        'lon': lon,
+        'opening_hours': tags.get('opening_hours'),
+        'source': "OpenStreetMap",
+    })
 
 
-def convert_google_to_clinic(place: Dict, user_lat: float, user_lon: float) -> Clinic:
-    """Convert Google Places result to Clinic model"""
+def google_row(place: Dict) -> Dict:
+    """Compact Clinic fields (without distance) for a Google Places result"""
     location = place.get('geometry', {}).get('location', {})
-    lat = location.get('lat')
-    lon = location.get('lng')
-
-    # Calculate distance
-    distance = None
-    if lat and lon:
-        from math import radians, sin, cos, sqrt, atan2
-        R = 6371
-
-        lat1, lon1 = radians(user_lat), radians(user_lon)
-        lat2, lon2 = radians(lat), radians(lon)
-
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = round(R * c, 2)
-
-    return Clinic(
-        id=f"google_{place.get('place_id', '')}",
-        name=place.get('name', ''),
-        address=place.get('vicinity'),
-        lat=lat,
-        lon=lon,
-        rating=place.get('rating'),
-        reviews_count=place.get('user_ratings_total'),
-        source="Google Places",
-        distance_km=distance
-    )
+    return compact({
+        'id': f"google_{place.get('place_id', '')}",
+        'name': place.get('name', ''),
+        'address': place.get('vicinity'),
+        'lat': location.get('lat'),
+        'lon': location.get('lng'),
+        'rating': place.get('rating'),
+        'reviews_count': place.get('user_ratings_total'),
+        'source': "Google Places",
+    })
+
+
+def local_row(position: int, clinic: Dict) -> Dict:
+    """Compact Clinic fields (without distance) for a clinic from the offline dataset"""
+    return compact({
+        'id': f"local_{position}",
+        'name': clinic['name'],
+        'address': clinic.get('address') or None,
+        'phone': clinic.get('phone'),
+        'website': clinic.get('link'),
+        'email': clinic.get('email'),
+        'postcode': clinic.get('postcode'),
+        'area': clinic.get('area'),
+        'lat': clinic['lat'],
+        'lon': clinic['lon'],
+        'rating': clinic.get('rating'),
+        'opening_hours': clinic.get('opening_hours'),
+        'source': clinic.get('source') or "OpenStreetMap",
+    })
+
+
+def round_distance(distance_km: Optional[float]) -> Optional[float]:
+    """Distance as shown to users (and sorted on)"""
+    return round(distance_km, 2) if distance_km is not None else None
+
+
+def to_clinic(row: Dict, distance_km: Optional[float]) -> Clinic:
+    """Build the response model for a row"""
+    return Clinic(**row, distance_km=distance_km)
+
+
+def load_local_index() -> Union[StoreSpatialIndex, GridIndex]:
+    """Spatial index over the offline clinic dataset (as rows), opened on first use"""
+    global _local_index
+
+    if _local_index is None:
+        store = open_store(LOCAL_STORE_FILE)
+        if store is not None:
+            _local_index = store.spatial_index(local_row)
+            return _local_index
+
+        points = []
+        try:
+            with open(LOCAL_DATA_FILE, 'r', encoding='utf-8') as f:
+                for position, clinic in enumerate(json.load(f)):
+                    if clinic.get('lat') is not None and clinic.get('lon') is not None and clinic.get('name'):
+                        points.append((clinic['lat'], clinic['lon'], local_row(position, clinic)))
+        except Exception as e:
+            print(f"Error loading local clinic data: {e}")
+        _local_index = GridIndex(points)
+    return _local_index
+
+
+def dedupe_by_name(ranked: List[Tuple[Optional[float], Dict]]) -> List[Tuple[Optional[float], Dict]]:
+    """Keep the first (distance_km, row) pair for each name"""
+    seen = set()
+    unique = []
+    for distance, row in ranked:
+        name_key = row['name'].lower().strip()
+        if name_key not in seen:
+            seen.add(name_key)
+            unique.append((distance, row))
+    return unique
+
+
+def rank_rows(ranked: List[Tuple[Optional[float], Dict]],
+              q: Optional[str]) -> List[Tuple[Optional[float], Dict]]:
+    """Query filter, distance sort and name dedup on (distance_km, row) pairs"""
+    if q:
+        q_lower = q.lower()
+        ranked = [
+            (distance, row) for distance, row in ranked
+            if q_lower in row['name'].lower()
+            or q_lower in (row.get('address') or '').lower()
+            or q_lower in (row.get('postcode') or '').lower()
+            or q_lower in (row.get('area') or '').lower()
+        ]
+
+    # Sort by distance
+    ranked.sort(key=lambda pair: pair[0] if pair[0] else 999)
+
+    # Deduplicate by name
+    return dedupe_by_name(ranked)
+
+
+async def live_rows(lat: float, lon: float, radius: int,
+                    use_google: bool) -> Tuple[List[Tuple[Optional[float], Dict]], bool]:
+    """
+    (distance_km, row) pairs from the live upstreams within radius meters
+    of a point, and whether they were all served from cache
+    """
+    # Assemble the tiles covering the search area (and optionally Google
+    # Places) concurrently; each upstream has its own deadline
+    radius_km = radius / 1000
+    lookups = [get_area_rows(lat, lon, radius_km)]
+    if use_google:
+        lookups.append(get_google_places(lat, lon, radius))
+    (osm_rows, cached), *google = await asyncio.gather(*lookups)
+
+    # Tiles cover the bounding box; distances for every row are computed
+    # in one batch and only those within the exact radius are kept
+    distances = batch_distances([row['lat'] for row in osm_rows], [row['lon'] for row in osm_rows],
+                                lat, lon, radius_km)
+    ranked = [(round_distance(distance), row)
+              for row, distance in zip(osm_rows, distances) if distance is not None]
+
+    # Optionally add Google Places results
+    if use_google:
+        google_rows, google_cached = google[0]
+        cached = cached and google_cached
+        distances = batch_distances([row.get('lat') for row in google_rows],
+                                    [row.get('lon') for row in google_rows], lat, lon)
+        ranked.extend((round_distance(distance), row)
+                      for row, distance in zip(google_rows, distances))
+
+    return ranked, cached
 
 
 # London center coordinates (default)
@@ -284,8 +507,11 @@ async def root():
         "version": "2.0.0",
         "endpoints": {
             "/search": "Live search for dental clinics",
+            "/nearby": "Clinics near a location (offline index)",
+            "/nearest": "k nearest clinics (offline index)",
             "/areas": "List of London areas",
-            "/health": "Health check"
+            "/health": "Health check",
+            "/stats": "Cache and request coalescing counters"
         }
     }
 
@@ -295,6 +521,16 @@ async def health():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
+@app.get("/stats")
+async def get_stats():
+    """Cache and upstream request coalescing counters"""
+    return {
+        "singleflight": _tile_cache.flights.stats(),
+        "tile_cache": _tile_cache.stats(),
+        "google_cache": _google_cache.stats(),
+    }
+
+
 @app.get("/areas")
 async def get_areas():
     """Get list of London areas for searching"""
@@ -310,7 +546,7 @@ async def search_clinics(
     area: Optional[str] = Query(None, description="London area (e.g., 'central', 'hackney')"),
     lat: Optional[float] = Query(None, description="Latitude for location-based search"),
     lon: Optional[float] = Query(None, description="Longitude for location-based search"),
-    radius: int = Query(5000, description="Search radius in meters (default 5km)"),
+    radius: int = Query(5000, gt=0, le=MAX_RADIUS_M, description="Search radius in meters (default 5km)"),
     limit: int = Query(50, description="Maximum results to return"),
     use_google: bool = Query(False, description="Also search Google Places (requires API key)")
 ):
@@ -333,88 +569,89 @@ async def search_clinics(
         # Default to central London
         search_lat, search_lon = LONDON_CENTER
 
-    # Check cache
-    cache_key = get_cache_key(q or '', search_lat, search_lon, radius)
-    cached_data = get_cached(cache_key)
-
-    if cached_data:
-        return SearchResponse(
-            clinics=cached_data['clinics'][:limit],
-            total=cached_data['total'],
-            source=cached_data['source'],
-            cached=True,
-            search_time_ms=int((time.time() - start_time) * 1000)
-        )
-
-    # Fetch from Overpass API
-    osm_elements = search_overpass(search_lat, search_lon, radius)
-
-    clinics = []
-    for element in osm_elements:
-        if element.get('type') in ('node', 'way') and element.get('tags'):
-            clinic = convert_osm_to_clinic(element, search_lat, search_lon)
-            if clinic:
-                clinics.append(clinic)
-
-    # Optionally add Google Places results
-    if use_google and GOOGLE_PLACES_API_KEY:
-        google_places = search_google_places(search_lat, search_lon, radius)
-        for place in google_places:
-            clinic = convert_google_to_clinic(place, search_lat, search_lon)
-            clinics.append(clinic)
-
-    # Filter by query if provided
-    if q:
-        q_lower = q.lower()
-        clinics = [
-            c for c in clinics
-            if q_lower in (c.name or '').lower()
-            or q_lower in (c.address or '').lower()
-            or q_lower in (c.postcode or '').lower()
-            or q_lower in (c.area or '').lower()
-        ]
+    use_google = use_google and bool(GOOGLE_PLACES_API_KEY)
+    ranked, cached = await live_rows(search_lat, search_lon, radius, use_google)
+    unique = rank_rows(ranked, q)
 
-    # Sort by distance
-    clinics.sort(key=lambda c: c.distance_km if c.distance_km else 999)
-
-    # Deduplicate by name
-    seen = set()
-    unique_clinics = []
-    for c in clinics:
-        name_key = c.name.lower().strip()
-        if name_key not in seen:
-            seen.add(name_key)
-            unique_clinics.append(c)
-
-    # Cache results
-    source = "OpenStreetMap" + (" + Google Places" if use_google and GOOGLE_PLACES_API_KEY else "")
-    set_cache(cache_key, {
-        'clinics': unique_clinics,
-        'total': len(unique_clinics),
-        'source': source
-    })
+    source = "OpenStreetMap" + (" + Google Places" if use_google else "")
 
+    # Models are only built for the rows returned
     return SearchResponse(
-        clinics=unique_clinics[:limit],
-        total=len(unique_clinics),
+        clinics=[to_clinic(row, distance) for distance, row in unique[:limit]],
+        total=len(unique),
         source=source,
-        cached=False,
+        cached=cached,
         search_time_ms=int((time.time() - start_time) * 1000)
     )
 
 
-@app.get("/nearby")
+@app.get("/nearby", response_model=SearchResponse)
 async def nearby_clinics(
     lat: float = Query(..., description="Latitude"),
     lon: float = Query(..., description="Longitude"),
-    radius: int = Query(2000, description="Radius in meters"),
-    limit: int = Query(20, description="Max results")
+    radius: int = Query(2000, gt=0, le=MAX_RADIUS_M, description="Radius in meters"),
+    limit: int = Query(20, description="Max results"),
+    fresh: bool = Query(False, description="Overlay live OpenStreetMap results")
 ):
     """
     Find dental clinics near a specific location
     Useful for "near me" functionality
+
+    Answered from the offline spatial index; with fresh=true, live
+    Overpass results for the area are merged in (live data wins on
+    duplicate names).
     """
-    return await search_clinics(lat=lat, lon=lon, radius=radius, limit=limit)
+    start_time = time.time()
+    index = load_local_index()
+    if not len(index):
+        # No offline data deployed: live search only
+        return await search_clinics(q=None, area=None, lat=lat, lon=lon,
+                                    radius=radius, limit=limit, use_google=False)
+
+    radius_km = radius / 1000
+    ranked = []
+    source = "Local index"
+    cached = True
+    if fresh:
+        live, cached = await live_rows(lat, lon, radius, use_google=False)
+        ranked.extend(rank_rows(live, None))
+        source += " + OpenStreetMap"
+
+    for distance, row in index.within(lat, lon, radius_km):
+        ranked.append((round_distance(distance), row))
+
+    # Live results come first, so they win on duplicate names
+    unique = dedupe_by_name(ranked)
+    unique.sort(key=lambda pair: pair[0] if pair[0] is not None else 999)
+
+    return SearchResponse(
+        clinics=[to_clinic(row, distance) for distance, row in unique[:limit]],
+        total=len(unique),
+        source=source,
+        cached=cached,
+        search_time_ms=int((time.time() - start_time) * 1000)
+    )
+
+
+@app.get("/nearest", response_model=SearchResponse)
+async def nearest_clinics(
+    lat: float = Query(..., description="Latitude"),
+    lon: float = Query(..., description="Longitude"),
+    k: int = Query(10, description="Number of clinics")
+):
+    """The k nearest clinics from the offline spatial index, at any distance"""
+    start_time = time.time()
+    index = load_local_index()
+    clinics = [to_clinic(row, round_distance(distance))
+               for distance, row in index.nearest(lat, lon, k)]
+
+    return SearchResponse(
+        clinics=clinics,
+        total=len(clinics),
+        source="Local index",
+        cached=True,
+        search_time_ms=int((time.time() - start_time) * 1000)
+    )
 
 
 # For local testing
@@ -7,21 +7,32 @@ Secure Dental Clinic Search API
 """
 
 from fastapi import FastAPI, Query, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
-from typing import List, Dict, Optional
-import requests
+from typing import List, Dict, NamedTuple, Optional, Tuple
 import json
 import time
 import os
 import hashlib
+import random
 import secrets
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
 import logging
+import math
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from _cache import TTLCache
+from _geocode_cache import GeocodeCache, cache_key
+from _geo import batch_distances, element_coords, haversine_km
+from _http import close_client, get_client
+from _postcodes import load_postcode_index, postcode_keys
+from _ratelimit import RateLimit, RateLimiter, make_backend
+
 # Load environment variables
 try:
     from dotenv import load_dotenv
@@ -55,6 +66,20 @@ FRONTEND_API_KEY = os.getenv("FRONTEND_API_KEY", secrets.token_urlsafe(32))
 # Add frontend key to allowed keys
 API_KEYS[FRONTEND_API_KEY] = {"name": "Frontend", "tier": "standard"}
 
+class KeyRecord(NamedTuple):
+    name: Optional[str]
+    tier: str
+
+def build_key_records(api_keys: Dict[str, Dict]) -> Dict[str, KeyRecord]:
+    """Resolve each key's name and tier once, not per request"""
+    return {key: KeyRecord(info.get("name"), info.get("tier", "free")) for key, info in api_keys.items()}
+
+KEY_RECORDS = build_key_records(API_KEYS)
+
+# Fraction of accepted requests written to the access log; rejected
+# requests are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01"))
+
 # Rate limiting config
 RATE_LIMITS = {
     "unlimited": {"requests": 10000, "window": 3600},  # 10k/hour
@@ -62,6 +87,10 @@ RATE_LIMITS = {
     "free": {"requests": 10, "window": 3600},          # 10/hour
 }
 
+# Share rate limits between worker processes through a SQLite file;
+# unset keeps them in this process
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+
 # CORS - Restrict to your domains in production
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
@@ -73,55 +102,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ==================== RATE LIMITING ====================
-
-rate_limit_store = defaultdict(lambda: {"count": 0, "reset_at": datetime.now()})
 
-def check_rate_limit(api_key: str, tier: str) -> bool:
-    """Check if request is within rate limit"""
-    limits = RATE_LIMITS.get(tier, RATE_LIMITS["free"])
-    key_data = rate_limit_store[api_key]
+@app.on_event("shutdown")
+async def shutdown():
+    await close_client()
 
-    now = datetime.now()
-    if now > key_data["reset_at"]:
-        key_data["count"] = 0
-        key_data["reset_at"] = now + timedelta(seconds=limits["window"])
-
-    key_data["count"] += 1
-    return key_data["count"] <= limits["requests"]
+# ==================== RATE LIMITING ====================
 
-def get_remaining_requests(api_key: str, tier: str) -> int:
-    """Get remaining requests for this key"""
-    limits = RATE_LIMITS.get(tier, RATE_LIMITS["free"])
-    key_data = rate_limit_store[api_key]
-    return max(0, limits["requests"] - key_data["count"])
+# GCRA: a tier's requests may burst at once, then refill evenly over the
+# window (no fixed-window edges to burst across)
+rate_limiter = RateLimiter(
+    {tier: RateLimit(limits["requests"], limits["window"]) for tier, limits in RATE_LIMITS.items()},
+    default_tier="free",
+    backend=make_backend(RATE_LIMIT_DB),
+)
 
 # ==================== AUTHENTICATION ====================
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+def client_host(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
 async def verify_api_key(request: Request, api_key: str = Depends(api_key_header)):
-    """Verify API key and check rate limits"""
-    # Log request
-    logger.info(f"Request: {request.method} {request.url.path} from {request.client.host}")
+    """
+    Verify API key and check rate limits
 
+    One dict lookup and one rate limiter step; the access log is sampled
+    and its message only formatted when written. The returned auth dict
+    carries the remaining quota, so handlers don't ask the limiter again.
+    """
     if not api_key:
+        logger.info("Request without API key: %s %s from %s",
+                    request.method, request.url.path, client_host(request))
         raise HTTPException(status_code=401, detail="API key required")
 
-    if api_key not in API_KEYS:
-        logger.warning(f"Invalid API key attempt from {request.client.host}")
+    record = KEY_RECORDS.get(api_key)
+    if record is None:
+        logger.warning("Invalid API key attempt from %s", client_host(request))
         raise HTTPException(status_code=403, detail="Invalid API key")
 
-    key_info = API_KEYS[api_key]
-    tier = key_info.get("tier", "free")
-
-    if not check_rate_limit(api_key, tier):
+    if rate_limiter.blocking:
+        # The shared SQLite backend can wait on other workers' locks
+        decision = await run_in_threadpool(rate_limiter.check, api_key, record.tier)
+    else:
+        decision = rate_limiter.check(api_key, record.tier)
+    if not decision.allowed:
+        logger.info("Rate limited: %s from %s", record.name, client_host(request))
         raise HTTPException(
             status_code=429,
-            detail="Rate limit exceeded. Please try again later."
+            detail="Rate limit exceeded. Please try again later.",
+            headers={"Retry-After": str(math.ceil(decision.retry_after))}
         )
 
-    return {"key": api_key, "tier": tier, "name": key_info.get("name")}
+    if ACCESS_LOG_SAMPLE_RATE > 0 and random.random() < ACCESS_LOG_SAMPLE_RATE:
+        logger.info("Request: %s %s from %s (%s)",
+                    request.method, request.url.path, client_host(request), record.name)
+
+    return {"key": api_key, "tier": record.tier, "name": record.name, "remaining": decision.remaining}
 
 # ==================== DATA MODELS ====================
 
@@ -149,31 +187,25 @@ class SearchResponse(BaseModel):
 
 # ==================== CACHE ====================
 
-_cache = {}
+# Bounded LRU/TTL cache with stale-while-revalidate; concurrent misses
+# for the same key share one upstream fetch
 CACHE_TTL = 300
+CACHE_STALE_TTL = 300
+_cache = TTLCache(ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, max_entries=512)
 
 def get_cache_key(lat: float, lon: float, radius: int) -> str:
     key_str = f"{lat:.3f}:{lon:.3f}:{radius}"
     return hashlib.md5(key_str.encode()).hexdigest()
 
-def get_cached(key: str) -> Optional[Dict]:
-    if key in _cache:
-        entry = _cache[key]
-        if datetime.now() < entry['expires']:
-            return entry['data']
-        del _cache[key]
-    return None
-
-def set_cache(key: str, data: Dict):
-    _cache[key] = {
-        'data': data,
-        'expires': datetime.now() + timedelta(seconds=CACHE_TTL)
-    }
-
 # ==================== DATA FETCHING ====================
 
-def fetch_clinics(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
-    """Fetch dental clinics - internal method, no source exposed"""
+async def fetch_clinics(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
+    """
+    Fetch dental clinics - internal method, no source exposed
+
+    Raises on upstream errors (including Overpass runtime errors reported
+    with HTTP 200), so they are never cached as an empty area.
+    """
     query = f"""
     [out:json][timeout:30];
     (
@@ -182,48 +214,118 @@ def fetch_clinics(lat: float, lon: float, radius_m: int = 5000) -> List[Dict]:
       node["healthcare"="dentist"](around:{radius_m},{lat},{lon});
       way["healthcare"="dentist"](around:{radius_m},{lat},{lon});
     );
-    out body;
-    >;
-    out skel qt;
+    out center;
     """
 
-    try:
-        response = requests.post(
-            "https://overpass-api.de/api/interpreter",
-            data={'data': query},
-            headers={'User-Agent': 'DentalSearchAPI/2.0'},
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get('elements', [])
-    except Exception as e:
-        logger.error(f"Data fetch error: {e}")
-        return []
+    response = await get_client().post(
+        "https://overpass-api.de/api/interpreter",
+        data={'data': query},
+        headers={'User-Agent': 'DentalSearchAPI/2.0'},
+        timeout=30
+    )
+    response.raise_for_status()
+    data = response.json()
+    # Query timeouts and memory errors come back as HTTP 200 with a remark
+    # and partial elements
+    remark = data.get('remark') or ''
+    if 'runtime error' in remark:
+        raise RuntimeError(f"Overpass {remark}")
+    return data.get('elements', [])
+
+
+async def fetch_rows(lat: float, lon: float, radius_m: int) -> List[Dict]:
+    """Fetch clinics around a point as compact rows (Clinic fields)"""
+    elements = [e for e in await fetch_clinics(lat, lon, radius_m)
+                if e.get('type') in ('node', 'way') and e.get('tags', {}).get('name')]
+    # Overpass already limits to the radius; distances in one batch
+    coords = [element_coords(e) for e in elements]
+    distances = batch_distances([c[0] for c in coords], [c[1] for c in coords], lat, lon)
+    rows = []
+    for element, distance in zip(elements, distances):
+        row = clinic_row(element, lat, lon, distance)
+        if row:
+            rows.append(row)
+
+    return rows
+
 
+def sort_key(row: Dict) -> float:
+    """Results are listed nearest first"""
+    return row['distance_km'] if row['distance_km'] else 999
 
-def convert_to_clinic(element: Dict, user_lat: float, user_lon: float) -> Optional[Clinic]:
-    """Convert raw data to proprietary Clinic format"""
+
+# A cached search: groups of rows sharing a lowercased name, each row as
+# (sorted position, lowercase search text, row)
+SearchEntry = Tuple[Tuple[Tuple[int, str, Dict], ...], ...]
+
+
+def search_text(row: Dict) -> str:
+    """Lowercased name, address and postcode, matched against q"""
+    return '\0'.join((row['name'] or '', row['address'] or '', row['postcode'] or '')).lower()
+
+
+async def fetch_entry(lat: float, lon: float, radius_m: int) -> SearchEntry:
+    """
+    Rows sorted by distance and grouped by lowercased name, as cached
+
+    Groups are in order of their nearest row, members nearest first. A
+    search answer is the first row in each group that matches q, so
+    results match filtering, sorting and deduplicating the whole list on
+    every request. Entries are tuples, shared by every hit and never
+    changed.
+    """
+    rows = sorted(await fetch_rows(lat, lon, radius_m), key=sort_key)
+    groups = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(row['name'].lower(), []).append((position, search_text(row), row))
+    return tuple(tuple(group) for group in groups.values())
+
+
+def pick_rows(entry: SearchEntry, q: Optional[str], limit: int) -> Tuple[List[Dict], int]:
+    """
+    The first limit sorted, deduplicated rows of an entry matching q,
+    and how many match in all. One pass; rows past limit are only counted.
+    """
+    if not q:
+        return [group[0][2] for group in entry[:limit]], len(entry)
+
+    q_lower = q.lower()
+    picked = []
+    total = 0
+    reordered = False
+    for group in entry:
+        for i, (position, text, row) in enumerate(group):
+            if q_lower in text:
+                total += 1
+                # A group answering with a farther row than its nearest one
+                # can move ahead of earlier groups, so from then on keep
+                # every match and sort. Matches already past limit stay out:
+                # any later match is farther than they are.
+                reordered = reordered or i > 0
+                if reordered or len(picked) < limit:
+                    picked.append((position, row))
+                break
+    if reordered:
+        picked.sort(key=lambda pair: pair[0])
+    return [row for _, row in picked[:limit]], total
+
+
+def clinic_row(element: Dict, user_lat: float, user_lon: float,
+               distance_km: Optional[float] = None) -> Optional[Dict]:
+    """Convert raw data to proprietary Clinic fields (a plain dict)"""
     tags = element.get('tags', {})
     name = tags.get('name')
 
     if not name:
         return None
 
-    lat = element.get('lat')
-    lon = element.get('lon')
+    # Ways are fetched with their center point
+    lat, lon = element_coords(element)
 
     # Calculate distance
-    distance = None
-    if lat and lon:
-        from math import radians, sin, cos, sqrt, atan2
-        R = 6371
-        lat1, lon1 = radians(user_lat), radians(user_lon)
-        lat2, lon2 = radians(lat), radians(lon)
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = round(R * c, 2)
+    if distance_km is None and lat is not None and lon is not None:
+        distance_km = haversine_km(user_lat, user_lon, lat, lon)
+    distance = round(distance_km, 2) if distance_km is not None else None
 
     # Build address
     address_parts = []
@@ -234,19 +336,19 @@ def convert_to_clinic(element: Dict, user_lat: float, user_lon: float) -> Option
     # Generate unique ID (proprietary, not exposing OSM ID)
     clinic_id = hashlib.md5(f"{name}{lat}{lon}".encode()).hexdigest()[:12]
 
-    return Clinic(
-        id=clinic_id,
-        name=name,
-        address=', '.join(address_parts) if address_parts else None,
-        phone=tags.get('phone') or tags.get('contact:phone'),
-        website=tags.get('website') or tags.get('contact:website'),
-        postcode=tags.get('addr:postcode'),
-        area=tags.get('addr:city') or tags.get('addr:suburb'),
-        lat=lat,
-        lon=lon,
-        opening_hours=tags.get('opening_hours'),
-        distance_km=distance
-    )
+    return {
+        'id': clinic_id,
+        'name': name,
+        'address': ', '.join(address_parts) if address_parts else None,
+        'phone': tags.get('phone') or tags.get('contact:phone'),
+        'website': tags.get('website') or tags.get('contact:website'),
+        'postcode': tags.get('addr:postcode'),
+        'area': tags.get('addr:city') or tags.get('addr:suburb'),
+        'lat': lat,
+        'lon': lon,
+        'opening_hours': tags.get('opening_hours'),
+        'distance_km': distance,
+    }
 
 # ==================== LONDON AREAS ====================
 
@@ -306,35 +408,59 @@ POSTCODE_COORDS = {
     'n16': (51.5630, -0.0750),   # Stoke Newington
 }
 
-def geocode_postcode(postcode: str) -> Optional[tuple]:
-    """Convert UK postcode to coordinates"""
-    # Normalize postcode (lowercase, remove spaces)
-    pc = postcode.lower().replace(' ', '')
+# Offline postcode centroids (scripts/build_postcode_index.py)
+POSTCODE_INDEX_FILE = Path(os.getenv("POSTCODE_INDEX_FILE", Path(__file__).parent.parent / "data" / "postcodes.bin"))
+_postcode_index = load_postcode_index(POSTCODE_INDEX_FILE)
+
+# Nominatim is only asked about queries the offline data can't place
+# when explicitly enabled; it is a network call on the search path
+NOMINATIM_FALLBACK = os.getenv("GEOCODE_NOMINATIM", "").lower() in ("1", "true", "yes")
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_TIMEOUT = 5
+
+# Nominatim answers (including "not found") persist across restarts
+GEOCODE_CACHE_FILE = Path(os.getenv("GEOCODE_CACHE_FILE", Path(__file__).parent.parent / "data" / "geocode_cache.db"))
+_geocode_cache = GeocodeCache(GEOCODE_CACHE_FILE) if NOMINATIM_FALLBACK else None
+
+@lru_cache(maxsize=4096)
+def geocode_postcode(postcode: str, allow_area: bool = False) -> Optional[tuple]:
+    """Convert UK postcode to coordinates (offline); a bare area only with allow_area"""
+    # Most specific level first: postcode, sector, district, area
+    for key in postcode_keys(postcode, allow_area):
+        if _postcode_index is not None:
+            coords = _postcode_index.lookup(key)
+            if coords is not None:
+                return coords
+        coords = POSTCODE_COORDS.get(key.lower())
+        if coords is not None:
+            return coords
 
-    # Try exact match first
-    if pc in POSTCODE_COORDS:
-        return POSTCODE_COORDS[pc]
+    return None
 
-    # Try prefix match (e.g., "nw6 7" -> "nw6")
-    for prefix in POSTCODE_COORDS:
-        if pc.startswith(prefix):
-            return POSTCODE_COORDS[prefix]
+async def fetch_nominatim(query: str) -> Optional[list]:
+    """[lat, lon] for free text from Nominatim, None if not found; raises on errors"""
+    response = await get_client().get(
+        NOMINATIM_URL,
+        params={'q': f'{query}, London, UK', 'format': 'json', 'limit': 1},
+        headers={'User-Agent': 'DentalSearchAPI/2.0'},
+        timeout=NOMINATIM_TIMEOUT
+    )
+    response.raise_for_status()
+    results = response.json()
+    if results:
+        return [float(results[0]['lat']), float(results[0]['lon'])]
+    return None
 
-    # Try geocoding via Nominatim
+async def geocode_nominatim(query: str) -> Optional[tuple]:
+    """Geocode free text via Nominatim (opt-in, see NOMINATIM_FALLBACK), through the cache"""
     try:
-        response = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params={'q': f'{postcode}, London, UK', 'format': 'json', 'limit': 1},
-            headers={'User-Agent': 'DentalSearchAPI/2.0'},
-            timeout=5
-        )
-        if response.ok and response.json():
-            result = response.json()[0]
-            return (float(result['lat']), float(result['lon']))
-    except:
-        pass
+        coords = await _geocode_cache.get_or_fetch(cache_key('nominatim', query),
+                                                   lambda: fetch_nominatim(query))
+    except Exception as e:
+        logger.warning("Nominatim geocoding failed for %s: %s", query, e)
+        return None
 
-    return None
+    return tuple(coords) if coords else None
 
 # ==================== API ENDPOINTS ====================
 
@@ -361,6 +487,15 @@ async def get_frontend_key():
     }
 
 
+@app.get("/stats")
+async def get_stats(auth: dict = Depends(verify_api_key)):
+    """Cache and upstream request coalescing counters"""
+    stats = {"singleflight": _cache.flights.stats(), "cache": _cache.stats()}
+    if _geocode_cache is not None:
+        stats["geocode_cache"] = _geocode_cache.stats()
+    return stats
+
+
 @app.get("/areas")
 async def get_areas(auth: dict = Depends(verify_api_key)):
     """Get list of available London areas"""
@@ -372,6 +507,7 @@ async def search_clinics(
     request: Request,
     auth: dict = Depends(verify_api_key),
     q: Optional[str] = Query(None, description="Search query or postcode"),
+    postcode: Optional[str] = Query(None, description="UK postcode, district or area (e.g. NW6 7AB, NW6, NW)"),
     area: Optional[str] = Query(None, description="London area"),
     lat: Optional[float] = Query(None, description="Latitude"),
     lon: Optional[float] = Query(None, description="Longitude"),
@@ -382,19 +518,28 @@ async def search_clinics(
     Search for dental clinics
 
     Requires valid API key in X-API-Key header
-    Supports postcode search (e.g., NW6, SW1, E14)
+    Supports postcode search (e.g., NW6, SW1, E14); a postcode area on its
+    own (e.g. NW) is only used when passed as postcode
     """
     start_time = time.time()
 
     # Determine search center
     search_lat, search_lon = None, None
 
+    if postcode:
+        coords = geocode_postcode(postcode, allow_area=True)
+        if coords:
+            search_lat, search_lon = coords
+            logger.debug("Geocoded postcode %s to %s", postcode, coords)
+
     # Check if query looks like a postcode
-    if q:
+    if search_lat is None and q:
         coords = geocode_postcode(q)
+        if coords is None and NOMINATIM_FALLBACK:
+            coords = await geocode_nominatim(q)
         if coords:
             search_lat, search_lon = coords
-            logger.info(f"Geocoded postcode {q} to {coords}")
+            logger.debug("Geocoded postcode %s to %s", q, coords)
 
     # Fall back to explicit lat/lon
     if search_lat is None and lat is not None and lon is not None:
@@ -408,51 +553,24 @@ async def search_clinics(
     if search_lat is None:
         search_lat, search_lon = LONDON_AREAS['central']
 
-    # Check cache
+    # Check cache: rows already sorted and deduplicated, never mutated
     cache_key = get_cache_key(search_lat, search_lon, radius)
-    cached_data = get_cached(cache_key)
+    try:
+        entry, _ = await _cache.get_or_fetch(
+            cache_key,
+            lambda: fetch_entry(search_lat, search_lon, radius)
+        )
+    except Exception as e:
+        logger.error("Data fetch error: %s", e)
+        raise HTTPException(status_code=503, detail="Clinic data temporarily unavailable")
 
-    if cached_data:
-        clinics = cached_data
-    else:
-        # Fetch fresh data
-        elements = fetch_clinics(search_lat, search_lon, radius)
-        clinics = []
-        for element in elements:
-            if element.get('type') in ('node', 'way') and element.get('tags'):
-                clinic = convert_to_clinic(element, search_lat, search_lon)
-                if clinic:
-                    clinics.append(clinic)
-
-        # Cache results
-        set_cache(cache_key, clinics)
-
-    # Filter by query
-    if q:
-        q_lower = q.lower()
-        clinics = [
-            c for c in clinics
-            if q_lower in (c.name or '').lower()
-            or q_lower in (c.address or '').lower()
-            or q_lower in (c.postcode or '').lower()
-        ]
-
-    # Sort by distance
-    clinics.sort(key=lambda c: c.distance_km if c.distance_km else 999)
-
-    # Deduplicate
-    seen = set()
-    unique_clinics = []
-    for c in clinics:
-        if c.name.lower() not in seen:
-            seen.add(c.name.lower())
-            unique_clinics.append(c)
-
-    remaining = get_remaining_requests(auth["key"], auth["tier"])
+    rows, total = pick_rows(entry, q, limit)
+    remaining = auth["remaining"]
 
+    # Models are only built for the rows returned
     return SearchResponse(
-        clinics=unique_clinics[:limit],
-        total=len(unique_clinics),
+        clinics=[Clinic(**r) for r in rows],
+        total=total,
         search_time_ms=int((time.time() - start_time) * 1000),
         remaining_requests=remaining
     )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold-start time to first /search response for api/index.py
+Compares loading from JSON against loading from the binary snapshot
+
+Each run is a fresh interpreter (like a cold serverless instance) in a
+scratch directory laid out like the deployment.
+"""
+
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "api"))
+from _snapshot import write_snapshot
+
+# Runs in the child: import the app and answer one search
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, 'api')
+import index
+imported = time.perf_counter()
+response = index.Response()
+results = asyncio.run(index.search_clinics(index.SearchRequest(search_text='dental', limit=20), response))
+end = time.perf_counter()
+print(json.dumps({
+    'first_response': end - start,
+    'data': end - imported,
+    'clinics': len(index.load_clinics()),
+}))
+"""
+
+
+def run_child(workdir: Path) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD],
+        cwd=workdir, capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def benchmark(workdir: Path, runs: int) -> dict:
+    run_child(workdir)  # warm the OS page cache
+    samples = [run_child(workdir) for _ in range(runs)]
+    return {
+        'clinics': samples[0]['clinics'],
+        'median_ms': statistics.median(s['first_response'] * 1000 for s in samples),
+        'data_ms': statistics.median(s['data'] * 1000 for s in samples),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark cold start (JSON vs snapshot)')
+    parser.add_argument('--source', '-s', default=str(ROOT / "data" / "all_clinics_combined.json"),
+                        help='Clinic JSON file to serve')
+    parser.add_argument('--runs', '-n', type=int, default=10, help='Cold starts per mode')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        shutil.copytree(ROOT / "api", workdir / "api",
+                        ignore=shutil.ignore_patterns('__pycache__'))
+        # First file load_clinics() looks for
+        (workdir / "data").mkdir()
+        shutil.copy(args.source, workdir / "data" / "all_clinics_combined.json")
+
+        print(f"⏱️  {args.runs} cold starts per mode, source: {args.source}\n")
+
+        results = {'JSON': benchmark(workdir, args.runs)}
+        write_snapshot(workdir / "clinics.snapshot", Path(args.source))
+        results['Snapshot'] = benchmark(workdir, args.runs)
+
+    print("  Medians; the remainder of first response is importing the app\n")
+    for mode, result in results.items():
+        print(f"  {mode:<9} {result['clinics']} clinics  "
+              f"first response {result['median_ms']:.1f} ms  "
+              f"(load + first search {result['data_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
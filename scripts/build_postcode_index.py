@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Build the offline postcode index used by api/secure_api.py
+From an ONS-style postcode centroid CSV (e.g. the ONS Postcode Directory:
+a postcode column and lat/long columns), or, without one, from the
+coordinates of the clinics in the combined dataset
+"""
+
+import csv
+import json
+import sys
+from pathlib import Path
+from typing import Iterator, Tuple
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "api"))
+from _postcodes import build_centroids, write_postcode_index
+
+POSTCODE_COLUMNS = ('pcds', 'pcd', 'postcode')
+LAT_COLUMNS = ('lat', 'latitude')
+LON_COLUMNS = ('long', 'lon', 'longitude')
+
+
+def pick_column(fieldnames, candidates) -> str:
+    lowered = {name.lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    raise ValueError(f"No column named any of {', '.join(candidates)}")
+
+
+def csv_points(csv_file: Path) -> Iterator[Tuple[str, float, float]]:
+    """(postcode, lat, lon) rows of a centroid CSV"""
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        postcode_col = pick_column(reader.fieldnames, POSTCODE_COLUMNS)
+        lat_col = pick_column(reader.fieldnames, LAT_COLUMNS)
+        lon_col = pick_column(reader.fieldnames, LON_COLUMNS)
+        for row in reader:
+            try:
+                lat, lon = float(row[lat_col]), float(row[lon_col])
+            except ValueError:
+                continue
+            # The ONSPD marks postcodes without a grid reference with 99.999999
+            if abs(lat) > 90:
+                continue
+            yield row[postcode_col], lat, lon
+
+
+def clinic_points(json_file: Path) -> Iterator[Tuple[str, float, float]]:
+    """(postcode, lat, lon) of clinics with both"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        for clinic in json.load(f):
+            if clinic.get('postcode') and clinic.get('lat') is not None and clinic.get('lon') is not None:
+                yield clinic['postcode'], clinic['lat'], clinic['lon']
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build offline postcode index')
+    parser.add_argument('--csv', help='Postcode centroid CSV (postcode, lat, long columns)')
+    parser.add_argument('--clinics', default=str(ROOT / "data" / "all_clinics_combined.json"),
+                        help='Clinic JSON used when no CSV is given')
+    parser.add_argument('--output', '-o', default=str(ROOT / "data" / "postcodes.bin"),
+                        help='Index file to write')
+
+    args = parser.parse_args()
+
+    source = Path(args.csv) if args.csv else Path(args.clinics)
+    if not source.exists():
+        print(f"❌ Source file not found: {source}")
+        sys.exit(1)
+
+    print(f"📮 Reading postcodes from {source}...")
+    points = csv_points(source) if args.csv else clinic_points(source)
+    centroids = build_centroids(points)
+
+    output = Path(args.output)
+    count = write_postcode_index(output, centroids)
+    size_kb = output.stat().st_size // 1024
+    print(f"✅ Wrote {count} postcodes, sectors, districts and areas to {output} ({size_kb} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Build the precompiled clinic snapshot loaded by api/index.py
+Run after the data files change (before deploying)
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "api"))
+from _snapshot import write_snapshot
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build clinic data snapshot')
+    parser.add_argument('--source', '-s', default=str(ROOT / "data" / "all_clinics_combined.json"),
+                        help='Clinic JSON file to compile')
+    parser.add_argument('--output', '-o', default=str(ROOT / "clinics.snapshot"),
+                        help='Snapshot file to write')
+
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    output = Path(args.output)
+    if not source.exists():
+        print(f"❌ Source file not found: {source}")
+        sys.exit(1)
+
+    print(f"📦 Compiling {source}...")
+    header = write_snapshot(output, source)
+    size_kb = output.stat().st_size // 1024
+    print(f"✅ Wrote {header['count']} clinics to {output} ({size_kb} KB)")
+    print(f"   Data version: {header['data_version']}")
+
+
+if __name__ == "__main__":
+    main()
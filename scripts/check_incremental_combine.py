@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Check that combine_all_data.py --incremental gives the same clusters,
+matches and merged clinics as a full run
+Each trial combines a random subset of the source records in full, then
+adds, removes, edits and duplicates records and combines the result both
+ways
+"""
+
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from combine_all_data import STATE_VERSION, combine, load_sources, record_fingerprint
+
+ROOT = Path(__file__).parent.parent
+
+SOURCES = [
+    ("Overpass API", ROOT / "data" / "dental_clinics_overpass.json"),
+    ("Private Clinics", ROOT / "data" / "private_dental_clinics_london.json"),
+    ("General Clinics", ROOT / "data" / "dental_clinics_london.json"),
+]
+
+Records = List[Tuple[str, str, Dict]]
+
+
+def as_inputs(records: Records) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """records and source_state as load_sources returns them"""
+    by_fingerprint = {}
+    source_state = {name: {'sha256': '', 'records': []} for name, _ in SOURCES}
+    for source, fingerprint, clinic in records:
+        if fingerprint not in by_fingerprint:
+            by_fingerprint[fingerprint] = clinic
+            source_state[source]['records'].append(fingerprint)
+    return by_fingerprint, source_state
+
+
+def edit(rng: random.Random, clinic: Dict, donor: Dict) -> Dict:
+    """A copy of clinic with one field changed, often to donor's value"""
+    clinic = dict(clinic)
+    field = rng.choice(['name', 'phone', 'postcode', 'address', 'coordinates'])
+    if field == 'coordinates':
+        clinic['lat'], clinic['lon'] = donor.get('lat'), donor.get('lon')
+    elif field == 'name' and rng.random() < 0.5:
+        clinic['name'] = f"{clinic['name']} Dental Care"
+    else:
+        clinic[field] = donor.get(field) if rng.random() < 0.8 else ''
+    if not clinic.get('name'):
+        clinic['name'] = donor['name']
+    return clinic
+
+
+def trial(rng: random.Random, all_records: Records) -> List[str]:
+    """Differences between an incremental and a full combine"""
+    before = [r for r in all_records if rng.random() < 0.9]
+    records, source_state = as_inputs(before)
+    clusters, merged, provenance, keys, matches = combine(records, source_state, None)
+    state = {
+        'version': STATE_VERSION,
+        'sources': source_state,
+        'records': records,
+        'keys': keys,
+        'matches': matches,
+        'clusters': clusters,
+        'merged': merged,
+        'provenance': provenance,
+    }
+
+    after = []
+    for source, fingerprint, clinic in all_records:
+        if fingerprint in records:
+            roll = rng.random()
+            if roll < 0.05:
+                continue
+            if roll < 0.10:
+                clinic = edit(rng, clinic, rng.choice(all_records)[2])
+                fingerprint = record_fingerprint(source, clinic)
+        elif rng.random() < 0.5:
+            continue
+        after.append((source, fingerprint, clinic))
+        if rng.random() < 0.05:
+            # A near duplicate, to grow blocks and add candidates
+            copy = edit(rng, clinic, rng.choice(all_records)[2])
+            after.append((source, record_fingerprint(source, copy), copy))
+
+    records, source_state = as_inputs(after)
+    incremental = combine(records, source_state, state)
+    full = combine(records, source_state, None)
+
+    names = ['clusters', 'merged clinics', 'provenance', 'keys', 'matches']
+    return [name for name, a, b in zip(names, incremental, full) if a != b]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare incremental and full combine runs')
+    parser.add_argument('--trials', type=int, default=5, help='Number of random trials')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    args = parser.parse_args()
+
+    records, source_state = load_sources(SOURCES, None)
+    all_records = [(name, fingerprint, records[fingerprint])
+                   for name, source in source_state.items() for fingerprint in source['records']]
+    rng = random.Random(args.seed)
+
+    failures = 0
+    for n in range(args.trials):
+        print(f"\n🔄 Trial {n}...")
+        differences = trial(rng, all_records)
+        if differences:
+            failures += 1
+            print(f"❌ Trial {n}: incremental run differs in {', '.join(differences)}")
+
+    if failures:
+        print(f"\n❌ {failures} of {args.trials} trials differ from a full run")
+        sys.exit(1)
+    print(f"\n✅ All {args.trials} incremental runs match a full run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Check that the SQLite rate limit backend (api/_ratelimit.py) enforces one
+limit across limiter instances and processes sharing the database file
+"""
+
+import sys
+import tempfile
+from multiprocessing import Pool
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from _ratelimit import RateLimit, RateLimiter, SQLiteBackend
+
+LIMITS = {'free': RateLimit(requests=20, window=3600)}
+
+
+def make_limiter(path: Path) -> RateLimiter:
+    return RateLimiter(LIMITS, default_tier='free', backend=SQLiteBackend(path))
+
+
+def allowed_in_process(args) -> int:
+    """Requests allowed out of count, from a fresh limiter in this process"""
+    path, key, count = args
+    limiter = make_limiter(Path(path))
+    return sum(limiter.check(key, 'free').allowed for _ in range(count))
+
+
+def check_instances(path: Path) -> list:
+    """Two limiters in one process, taking turns on one key"""
+    errors = []
+    limiters = [make_limiter(path), make_limiter(path)]
+    decisions = [limiters[n % 2].check('shared', 'free') for n in range(30)]
+    allowed = sum(d.allowed for d in decisions)
+    if allowed != 20:
+        errors.append(f"two instances allowed {allowed} of 30 requests, expected 20")
+    if any(d.allowed for d in decisions[20:]):
+        errors.append("a request was allowed after the burst was used up")
+    if not all(d.retry_after > 0 for d in decisions[20:]):
+        errors.append("refused requests have no retry_after")
+    if limiters[0].check('other', 'free').allowed is not True:
+        errors.append("another key was limited")
+    return errors
+
+
+def check_processes(path: Path, workers: int = 4) -> list:
+    """Several processes hammering one key at once"""
+    with Pool(workers) as pool:
+        allowed = sum(pool.map(allowed_in_process, [(str(path), 'busy', 15)] * workers))
+    if allowed != 20:
+        return [f"{workers} processes allowed {allowed} of {workers * 15} requests, expected 20"]
+    return []
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        errors = check_instances(Path(tmp) / "instances.db")
+        errors += check_processes(Path(tmp) / "processes.db")
+
+    for error in errors:
+        print(f"❌ {error}")
+    if errors:
+        sys.exit(1)
+    print("✅ The SQLite backend enforces one limit across instances and processes")
+
+
+if __name__ == "__main__":
+    main()
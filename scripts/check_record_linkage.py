@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Check record_linkage.py against pinned cases from the shipped sources:
+branches of a chain, similar names far apart and numbered names must
+stay apart, while duplicates of one clinic across sources are merged
+"""
+
+import sys
+from typing import Dict, List, Tuple
+
+from record_linkage import link_records
+
+ZENTAL_PHONE = '+44 20 3982 8602'
+
+# (description, clinics, expected clusters of indices)
+CASES: List[Tuple[str, List[Dict], List[List[int]]]] = [
+    ("Branches sharing a booking number stay apart", [
+        {'name': 'Zental Dental Cricklewood', 'address': '55, Cricklewood Broadway, London, NW2 3JX',
+         'postcode': 'NW2 3JX', 'phone': ZENTAL_PHONE, 'lat': 51.553425, 'lon': -0.2117922},
+        {'name': "Zental Dental Earl's Court", 'address': '221-225, Old Brompton Road, London, SW5 0EA',
+         'postcode': 'SW5 0EA', 'phone': ZENTAL_PHONE, 'lat': 51.4894707, 'lon': -0.1897476},
+        {'name': 'Zental Dental Barnet', 'address': '85, High Street, Barnet, EN5 5UR',
+         'postcode': 'EN5 5UR', 'phone': ZENTAL_PHONE, 'lat': 51.6544466, 'lon': -0.2017741},
+        {'name': 'Zental Dental Knightsbridge', 'address': '15-17, Walton Street, London, SW3 2HX',
+         'postcode': 'SW3 2HX', 'phone': ZENTAL_PHONE},
+        {'name': 'Zental Dental Bexleyheath', 'address': '4-5, Market Place, Kent, DA6 7DU',
+         'postcode': 'DA6 7DU', 'phone': ZENTAL_PHONE},
+    ], [[0], [1], [2], [3], [4]]),
+    ("A similar name 14 km away isn't a duplicate", [
+        {'name': 'Carlton Dental', 'address': '', 'lat': 51.3714788, 'lon': -0.1671123},
+        {'name': 'Charlton Dental Clinic', 'address': '88, Charlton Road, London, SE7 7EZ',
+         'postcode': 'SE7 7EZ', 'phone': '+44 20 8858 0481', 'lat': 51.4793001, 'lon': 0.0267915},
+        {'name': 'Charlton Dental Clinic', 'address': '88, Charlton Road, Greater London, SE7 7EZ',
+         'postcode': 'SE7 7EZ', 'phone': '+44 20 8858 0481'},
+    ], [[0], [1, 2]]),
+    ("Different numbers in the name stay apart", [
+        {'name': 'Number 18 Dental', 'address': '18, Garway Road', 'lat': 51.5151546, 'lon': -0.19176},
+        {'name': 'Number 1 Dental Clinic', 'address': '1, Lydford Road, London, NW2 5QY',
+         'postcode': 'NW2 5QY'},
+        {'name': 'Number 1 Dental Clinic', 'address': '1, Lydford Road, Greater London, NW2 5QY',
+         'postcode': 'NW2 5QY'},
+    ], [[0], [1, 2]]),
+    ("A record without a location can't chain clinics far apart", [
+        {'name': 'Smile Care', 'address': '', 'lat': 51.50, 'lon': -0.12},
+        {'name': 'Smile Care', 'address': ''},
+        {'name': 'Smile Care', 'address': '', 'lat': 51.55, 'lon': -0.12},
+    ], [[0, 1], [2]]),
+    ("Duplicates of one clinic are merged", [
+        {'name': 'Bridge Dental Practice', 'address': 'Northolt Road', 'phone': '+44 20 8422 2736',
+         'lat': 51.564903, 'lon': -0.3530404},
+        {'name': 'Bridge Dental Care', 'address': '271, Northolt Road, HA2 8HS', 'postcode': 'HA2 8HS',
+         'phone': '+44 20 8422 2736', 'lat': 51.5636287, 'lon': -0.3545846},
+        {'name': 'Image Dental Clinic', 'address': '', 'lat': 51.5194686, 'lon': -0.139997},
+        {'name': 'Image Dental Clinic', 'address': '21, Foley Street, City of Westminster, W1W 7TN',
+         'postcode': 'W1W 7TN'},
+    ], [[0, 1], [2, 3]]),
+]
+
+
+def main():
+    failures = 0
+    for description, clinics, expected in CASES:
+        clusters, _ = link_records(clinics)
+        if clusters != expected:
+            failures += 1
+            print(f"❌ {description}: got {clusters}, expected {expected}")
+        else:
+            print(f"✅ {description}")
+
+    if failures:
+        print(f"\n❌ {failures} of {len(CASES)} cases failed")
+        sys.exit(1)
+    print(f"\n✅ All {len(CASES)} cases pass")
+
+
+if __name__ == "__main__":
+    main()
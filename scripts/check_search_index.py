@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Check that /search in api/index.py returns the same results as the
+original linear scan over every clinic
+Runs random searches built from the dataset's own names, areas, services
+and languages, and also walks each search page by page with cursors
+"""
+
+import asyncio
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "api"))
+import index
+from _search_index import ClinicIndex
+
+FACETS = {
+    'nhs': 'nhs',
+    'private': 'private',
+    'emergency': 'emergency',
+    'children': 'children',
+    'wheelchair': 'wheelchair_access',
+    'parking': 'parking',
+}
+
+
+def reference_score(clinic: Dict, search_text: Optional[str],
+                    selected_services: List[str], selected_languages: List[str]) -> Dict:
+    """calculate_match_score as it was before the index"""
+    score = 0
+    max_score = 100
+    match_details = []
+    matched_services = []
+    matched_languages = []
+
+    if search_text:
+        text = search_text.lower()
+        if text in (clinic.get('name') or '').lower():
+            score += 12
+            match_details.append('Name matches')
+        if text in (clinic.get('address') or '').lower():
+            score += 8
+            match_details.append('Address matches')
+        if any(text in l.lower() for l in clinic.get('languages') or []):
+            score += 5
+            match_details.append('Language matches')
+        if any(text in s.lower() for s in clinic.get('services') or []):
+            score += 5
+            match_details.append('Service matches')
+    else:
+        max_score -= 30
+
+    if selected_services:
+        clinic_services = clinic.get('services') or []
+        matched_services = [s for s in selected_services
+                            if any(cs.lower() == s.lower() for cs in clinic_services)]
+        score += (len(matched_services) / len(selected_services)) * 40
+        if matched_services:
+            match_details.append(f"{len(matched_services)}/{len(selected_services)} services matched")
+    else:
+        max_score -= 40
+
+    if selected_languages:
+        clinic_languages = clinic.get('languages') or []
+        matched_languages = [l for l in selected_languages
+                             if any(cl.lower() == l.lower() for cl in clinic_languages)]
+        score += (len(matched_languages) / len(selected_languages)) * 30
+        if matched_languages:
+            match_details.append(f"{len(matched_languages)}/{len(selected_languages)} languages matched")
+    else:
+        max_score -= 30
+
+    percentage = int((score / max_score) * 100) if max_score > 0 else 100
+    return {
+        "score": percentage,
+        "details": match_details,
+        "matched_services": matched_services,
+        "matched_languages": matched_languages
+    }
+
+
+def reference_search(clinics: List[Dict], request: index.SearchRequest) -> List[Dict]:
+    """The original /search: filter, score and sort every clinic"""
+    results = []
+    for clinic in clinics:
+        if any(getattr(request, name) is not None and clinic.get(field) != getattr(request, name)
+               for name, field in FACETS.items()):
+            continue
+        if request.min_rating and (not clinic.get('rating') or clinic['rating'] < request.min_rating):
+            continue
+
+        address = clinic.get('address') or ''
+        if request.area:
+            area = request.area.lower()
+            if area not in (clinic.get('area') or '').lower() and area not in address.lower():
+                continue
+        if request.postcode:
+            postcode = request.postcode.upper()
+            if postcode not in (clinic.get('postcode') or '').upper() and postcode not in address.upper():
+                continue
+
+        if request.search_text:
+            text = request.search_text.lower()
+            if not (text in (clinic.get('name') or '').lower()
+                    or text in address.lower()
+                    or any(text in l.lower() for l in clinic.get('languages') or [])
+                    or any(text in s.lower() for s in clinic.get('services') or [])):
+                continue
+
+        match = reference_score(clinic, request.search_text, request.services, request.languages)
+        if match['score'] < request.min_score:
+            continue
+        results.append({"clinic": clinic, "match": match, "score": match['score']})
+
+    if request.sort_by == "match":
+        results.sort(key=lambda x: x['score'], reverse=True)
+    elif request.sort_by == "name":
+        results.sort(key=lambda x: x['clinic'].get('name') or '')
+    elif request.sort_by == "services":
+        results.sort(key=lambda x: len(x['clinic'].get('services') or []), reverse=True)
+    elif request.sort_by == "rating":
+        results.sort(key=lambda x: x['clinic'].get('rating') or 0, reverse=True)
+
+    if request.limit:
+        results = results[:request.limit]
+    return results
+
+
+def vocabulary(clinics: List[Dict]) -> Dict[str, List[str]]:
+    """Query terms drawn from the data, plus a few that match nothing"""
+    words = set()
+    for clinic in clinics:
+        for field in ('name', 'address'):
+            words.update((clinic.get(field) or '').split())
+    words = sorted(words)
+    services = sorted({s for c in clinics for s in c.get('services') or []})
+    languages = sorted({l for c in clinics for l in c.get('languages') or []})
+    return {
+        'texts': words + ['', 'a', 'de', 'dental', 'road ', ' l', 'xyzq'],
+        'services': services + ['No Such Service'],
+        'languages': languages + ['Klingon'],
+        'areas': sorted({c['area'] for c in clinics if c.get('area')}) + ['nowhere'],
+        'postcodes': sorted({c['postcode'][:3] for c in clinics if c.get('postcode')}) + ['ZZ9'],
+    }
+
+
+def random_request(rng: random.Random, vocab: Dict[str, List[str]]) -> Dict:
+    request = {
+        'search_text': rng.choice(vocab['texts']) if rng.random() < 0.7 else None,
+        'services': rng.sample(vocab['services'], rng.randint(0, min(2, len(vocab['services'])))),
+        'languages': rng.sample(vocab['languages'], rng.randint(0, min(2, len(vocab['languages'])))),
+        'min_score': rng.choice([0, 0, 30, 50, 100]),
+        'sort_by': rng.choice(['match', 'name', 'services', 'rating', 'other']),
+    }
+    for name in FACETS:
+        if rng.random() < 0.2:
+            request[name] = rng.choice([True, False])
+    if rng.random() < 0.2:
+        request['area'] = rng.choice(vocab['areas'])
+    if rng.random() < 0.2:
+        request['postcode'] = rng.choice(vocab['postcodes'])
+    if rng.random() < 0.2:
+        request['min_rating'] = rng.choice([3.0, 4.0, 4.5])
+    return request
+
+
+def comparable(results: List[Dict], positions: Dict[int, int]) -> List[tuple]:
+    return [(positions[id(r['clinic'])], r['score'], r['match']) for r in results]
+
+
+async def indexed_pages(fields: Dict, page_size: int) -> List[Dict]:
+    """Every result of a search, fetched page by page with cursors"""
+    results = []
+    cursor = None
+    while True:
+        response = index.Response()
+        page = await index.search_clinics(
+            index.SearchRequest(**fields, limit=page_size, cursor=cursor), response)
+        results.extend(page)
+        cursor = response.headers.get('x-next-cursor')
+        if not cursor:
+            return results
+
+
+async def check(clinics: List[Dict], searches: int, seed: int) -> int:
+    index._set_data(clinics, 'check', ClinicIndex(clinics))
+    positions = {id(clinic): i for i, clinic in enumerate(clinics)}
+    vocab = vocabulary(clinics)
+    rng = random.Random(seed)
+
+    failures = 0
+    for n in range(searches):
+        fields = random_request(rng, vocab)
+        limit = rng.choice([None, 5, 20, 50])
+        request = index.SearchRequest(**fields, limit=limit)
+
+        expected = comparable(reference_search(clinics, request), positions)
+        actual = comparable(await index.search_clinics(request, index.Response()), positions)
+        if actual != expected:
+            failures += 1
+            print(f"❌ Search {n} differs ({len(actual)} vs {len(expected)} results): {fields}, limit={limit}")
+            continue
+
+        if n % 10 == 0:
+            request = index.SearchRequest(**fields)
+            expected = comparable(reference_search(clinics, request), positions)
+            paged = comparable(await indexed_pages(fields, rng.choice([1, 7, 25])), positions)
+            if paged != expected:
+                failures += 1
+                print(f"❌ Search {n} differs when paged with cursors: {fields}")
+    return failures
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare indexed /search against a linear scan')
+    parser.add_argument('--data', default=str(ROOT / "data" / "all_clinics_combined.json"),
+                        help='Clinic JSON to search')
+    parser.add_argument('--searches', type=int, default=500, help='Number of random searches')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    args = parser.parse_args()
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        clinics = json.load(f)
+
+    print(f"🔍 Running {args.searches} searches over {len(clinics)} clinics from {args.data}...")
+    failures = asyncio.run(check(clinics, args.searches, args.seed))
+    if failures:
+        print(f"❌ {failures} searches differ from the linear scan")
+        sys.exit(1)
+    print(f"✅ All {args.searches} searches match the linear scan")
+
+
+if __name__ == "__main__":
+    main()
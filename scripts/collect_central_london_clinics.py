@@ -13,6 +13,9 @@ from datetime import datetime
 from typing import List, Dict, Set
 import requests
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from _geocode_cache import GeocodeCache, cache_key
+
 # London Zone 1 and Zone 2 postcodes
 ZONE_1_2_POSTCODES = [
     # Zone 1
@@ -52,6 +55,9 @@ INTERVAL_HOURS = 3  # Run every 3 hours
 STATE_FILE = Path("data/collection_state.json")
 CLINICS_FILE = Path("dentaltrawler/src/clinics.js")
 JSON_FILE = Path("data/private_dental_clinics_london.json")
+# Nominatim searches are cached across runs; empty results expire sooner
+GEOCODE_CACHE_FILE = Path("data/geocode_cache.db")
+SEARCH_CACHE_TTL = 7 * 24 * 3600
 
 
 class Zone1Zone2Collector:
@@ -63,6 +69,9 @@ class Zone1Zone2Collector:
             'User-Agent': 'DentalTrawler/1.0'
         }
         self.state = self.load_state()
+        self.cache = GeocodeCache(GEOCODE_CACHE_FILE, ttl=SEARCH_CACHE_TTL)
+        # Nominatim requests actually sent (cache misses)
+        self.requests_sent = 0
     
     def load_state(self) -> Dict:
         """Load collection state"""
@@ -144,11 +153,15 @@ class Zone1Zone2Collector:
             'extratags': 1
         }
         
-        try:
+        def fetch():
             time.sleep(1)  # Rate limiting
+            self.requests_sent += 1
             response = requests.get(url, headers=self.headers, params=params, timeout=10)
             response.raise_for_status()
             return response.json()
+
+        try:
+            return self.cache.get_or_fetch_sync(cache_key('search', params['q'], params['limit']), fetch) or []
         except Exception as e:
             print(f"  ⚠️  API Error: {e}")
             return []
@@ -250,16 +263,18 @@ class Zone1Zone2Collector:
                 continue
             
             print(f"🔍 Searching {area}...")
+            sent = self.requests_sent
             for query, _ in search_queries:
+                # search_osm waits before each request it sends
                 places = self.search_osm(query, location=area, limit=20)
                 for place in places:
                     clinic = self.convert_to_clinic_format(place)
                     if clinic.get('name') and self.is_zone_1_2(clinic):
                         new_clinics.append(clinic)
-                time.sleep(1)  # Rate limiting
             
             self.state['areas_searched'].append(area)
-            time.sleep(2)  # Extra delay between areas
+            if self.requests_sent > sent:
+                time.sleep(2)  # Extra delay between areas
         
         # Search by postcode
         for postcode in ZONE_1_2_POSTCODES[:30]:  # Search more postcodes for Zone 1 & 2
@@ -267,15 +282,16 @@ class Zone1Zone2Collector:
                 continue
             
             print(f"🔍 Searching postcode {postcode}...")
+            sent = self.requests_sent
             places = self.search_osm("dentist", location=f"London {postcode}", limit=20)
             for place in places:
                 clinic = self.convert_to_clinic_format(place)
                 if clinic.get('name') and self.is_zone_1_2(clinic):
                     new_clinics.append(clinic)
-            time.sleep(1)
             
             self.state['postcodes_searched'].append(postcode)
-            time.sleep(2)
+            if self.requests_sent > sent:
+                time.sleep(2)
         
         # Deduplicate
         print(f"\n📋 Found {len(new_clinics)} potential new clinics")
@@ -1,44 +1,98 @@
 """
 Combine all dental clinic data sources and update frontend
+With --incremental, only records that are new or changed since the last
+run, and those sharing a block with them, are linked again and merged
+(see COMBINE_STATE_FILE), and a diff of the merged clinics is written
 """
 
+import hashlib
 import json
+import sqlite3
+import sys
+from collections import defaultdict
 from pathlib import Path
-from typing import List, Dict
-import re
+from typing import Any, List, Dict, Optional, Tuple
 
-def normalize_phone(phone: str) -> str:
-    """Normalize phone number for comparison"""
-    if not phone:
-        return ''
-    # Remove all non-digits except +
-    return re.sub(r'[^\d+]', '', phone)
+from record_linkage import LinkRecord, link_records
 
-def normalize_name(name: str) -> str:
-    """Normalize clinic name for comparison"""
-    if not name:
-        return ''
-    # Lowercase, remove common words, extra spaces
-    name = name.lower().strip()
-    name = re.sub(r'\b(dental|dentist|surgery|practice|clinic|centre|center|ltd|limited)\b', '', name)
-    name = re.sub(r'[^\w\s]', '', name)
-    name = re.sub(r'\s+', ' ', name).strip()
-    return name
-
-def merge_clinic_data(existing: Dict, new: Dict) -> Dict:
-    """Merge two clinic records, preferring non-empty values"""
-    merged = existing.copy()
-
-    for key, value in new.items():
-        if value and not merged.get(key):
-            merged[key] = value
-        # For lists, merge them
-        elif isinstance(value, list) and value:
-            existing_list = merged.get(key, [])
-            if isinstance(existing_list, list):
-                merged[key] = list(set(existing_list + value))
-
-    return merged
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from _clinic_store import write_store
+from _snapshot import data_version
+
+# Canonical merged store kept between runs (relative to base path)
+COMBINE_STATE_FILE = Path("data") / "combine_state.json"
+COMBINE_DIFF_FILE = Path("data") / "combine_diff.json"
+STATE_VERSION = 4
+
+# SQLite store read by the APIs (api/_clinic_store.py)
+CLINIC_STORE_FILE = Path("data") / "clinics.db"
+
+class ClinicAccumulator:
+    """
+    Merge the records of one cluster, preferring non-empty values
+
+    Scalars keep the first non-empty value seen; list fields are ordered
+    sets in first-seen order. provenance records which sources supplied
+    each field. Adding a record costs O(its fields), and the result only
+    depends on the order records are added in.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.lists: Dict[str, Dict[Any, Any]] = {}
+        self.provenance: Dict[str, List[str]] = {}
+        self.records = 0
+
+    def _credit(self, key: str, source: Optional[str]):
+        if source is None:
+            return
+        sources = self.provenance.setdefault(key, [])
+        if source not in sources:
+            sources.append(source)
+
+    def add(self, clinic: Dict, source: Optional[str] = None):
+        first = self.records == 0
+        self.records += 1
+        for key, value in clinic.items():
+            current = self.fields.get(key)
+            if key in self.lists and current:
+                # Ordered-set union with the list already kept
+                if isinstance(value, list):
+                    items = self.lists[key]
+                    added = len(items)
+                    for item in value:
+                        items.setdefault(_item_key(item), item)
+                    if len(items) > added:
+                        self._credit(key, source)
+            elif value and not current:
+                self._set(key, value)
+                self._credit(key, source)
+            elif first:
+                self._set(key, value)
+
+    def _set(self, key: str, value: Any):
+        if isinstance(value, list):
+            items = {}
+            for item in value:
+                items.setdefault(_item_key(item), item)
+            self.lists[key] = items
+            self.fields[key] = bool(items)
+        else:
+            self.lists.pop(key, None)
+            self.fields[key] = value
+
+    def finalize(self) -> Dict:
+        """The merged clinic, fields in first-seen order"""
+        return {key: list(self.lists[key].values()) if key in self.lists else value
+                for key, value in self.fields.items()}
+
+def _item_key(item: Any) -> Any:
+    """Hashable identity of a list item"""
+    try:
+        hash(item)
+        return item
+    except TypeError:
+        return json.dumps(item, sort_keys=True)
 
 def load_json_file(filepath: Path) -> List[Dict]:
     """Load JSON file safely"""
@@ -50,12 +104,207 @@ def load_json_file(filepath: Path) -> List[Dict]:
         print(f"  ⚠️  Error loading {filepath}: {e}")
     return []
 
+def file_hash(filepath: Path) -> str:
+    """sha256 of a file's bytes, or '' if it doesn't exist"""
+    if not filepath.exists():
+        return ''
+    return hashlib.sha256(filepath.read_bytes()).hexdigest()
+
+def record_fingerprint(source: str, clinic: Dict) -> str:
+    """Stable id of a raw record: its source and content"""
+    canonical = json.dumps(clinic, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(f"{source}\n{canonical}".encode('utf-8')).hexdigest()[:20]
+
+def merge_cluster(clinics: List[Dict], sources: List[str]) -> Tuple[Dict, Dict[str, List[str]]]:
+    """Merge the records of one cluster, in order, and their provenance"""
+    accumulator = ClinicAccumulator()
+    for clinic, source in zip(clinics, sources):
+        accumulator.add(clinic, source)
+    return accumulator.finalize(), accumulator.provenance
+
+def load_state(filepath: Path) -> Optional[Dict]:
+    """Previous run's state, or None if missing or from another version"""
+    state = load_json_file(filepath) if filepath.exists() else None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+def save_state(filepath: Path, state: Dict):
+    """Write the state atomically"""
+    tmp_file = filepath.with_name(filepath.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    tmp_file.replace(filepath)
+
+def load_sources(sources: List[Tuple[str, Path]],
+                 state: Optional[Dict]) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Current records of every source by fingerprint, and the per-source
+    state (file hash, fingerprints). Sources whose file hash matches the
+    state aren't read at all.
+    """
+    previous = state['sources'] if state else {}
+    records = {}
+    source_state = {}
+
+    for name, filepath in sources:
+        digest = file_hash(filepath)
+        old = previous.get(name)
+        if old and old['sha256'] == digest:
+            print(f"\n📂 {name}: unchanged ({len(old['records'])} records)")
+            for fingerprint in old['records']:
+                records[fingerprint] = state['records'][fingerprint]
+            source_state[name] = old
+            continue
+
+        print(f"\n📂 Loading {name}...")
+        data = load_json_file(filepath)
+        print(f"   Found {len(data)} records")
+        fingerprints = []
+        for clinic in data:
+            if not clinic.get('name', ''):
+                continue
+            fingerprint = record_fingerprint(name, clinic)
+            if fingerprint not in records:
+                records[fingerprint] = clinic
+                fingerprints.append(fingerprint)
+        source_state[name] = {'sha256': digest, 'records': fingerprints}
+
+    return records, source_state
+
+def combine(records: Dict[str, Dict], source_state: Dict[str, Dict],
+            state: Optional[Dict]) -> Tuple[List[List[str]], List[Dict], List[Dict],
+                                            Dict[str, List[str]], List[List]]:
+    """
+    Deduplicate records into clusters and merge each cluster
+
+    Without state every record is linked from scratch. With state, only
+    records whose blocking candidates may have changed (those sharing a
+    block with an added or removed record, see record_linkage) are
+    compared again; the previous matches stand for the rest. Either way
+    the clusters are the same. Clusters that are unchanged reuse their
+    stored merged clinic.
+
+    Returns (clusters of fingerprints, merged clinics, their field
+    provenance, blocking keys, matched pairs as [fp, fp, strength]).
+    """
+    # Records' load order, the same in full and incremental runs
+    order = list(records)
+    index = {fp: i for i, fp in enumerate(order)}
+
+    if state is None:
+        keys = {fp: sorted(LinkRecord(records[fp]).keys) for fp in order}
+        previous = None
+        changed = None
+    else:
+        known = state['records']
+        added = [fp for fp in order if fp not in known]
+        removed = [fp for fp in known if fp not in index]
+        keys = {fp: state['keys'][fp] for fp in order if fp in known}
+        keys.update((fp, sorted(LinkRecord(records[fp]).keys)) for fp in added)
+
+        changed = defaultdict(int)
+        for fp in added:
+            for key in keys[fp]:
+                changed[key] += 1
+        for fp in removed:
+            for key in state['keys'][fp]:
+                changed[key] -= 1
+
+        previous = {}
+        for fp_a, fp_b, strength in state['matches']:
+            if fp_a in index and fp_b in index:
+                previous[tuple(sorted((index[fp_a], index[fp_b])))] = strength
+        print(f"   {len(added)} new records, {len(removed)} removed")
+
+    linked, matches = link_records(
+        [records[fp] for fp in order],
+        keys=[keys[fp] for fp in order],
+        previous=previous,
+        changed=changed,
+    )
+
+    record_source = {fp: name for name, source in source_state.items() for fp in source['records']}
+    previous_merged = {}
+    if state is not None:
+        previous_merged = {tuple(members): (merged, provenance) for members, merged, provenance
+                           in zip(state['clusters'], state['merged'], state['provenance'])}
+    clusters = []
+    merged_clinics = []
+    provenances = []
+    for members in linked:
+        fingerprints = [order[i] for i in members]
+        found = previous_merged.get(tuple(fingerprints))
+        if found is None:
+            found = merge_cluster([records[fp] for fp in fingerprints],
+                                  [record_source[fp] for fp in fingerprints])
+        clusters.append(fingerprints)
+        merged_clinics.append(found[0])
+        provenances.append(found[1])
+
+    matched = [[order[i], order[j], strength] for (i, j), strength in sorted(matches.items())]
+    return clusters, merged_clinics, provenances, keys, matched
+
+def save_diff(filepath: Path, diff: Dict):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(diff, f, indent=2, ensure_ascii=False)
+
+def diff_clusters(state: Dict, clusters: List[List[str]], merged_clinics: List[Dict]) -> Dict:
+    """
+    Merged clinics added, removed and changed since the previous run
+
+    A new cluster is the same clinic as an old one if they share a record,
+    or otherwise (an edited record gets a new fingerprint) the same name
+    and postcode.
+    """
+    def identity(clinic: Dict) -> Tuple[str, str]:
+        return clinic.get('name', '').strip().lower(), (clinic.get('postcode') or '').replace(' ', '').upper()
+
+    owner = {fp: i for i, members in enumerate(state['clusters']) for fp in members}
+    unmatched = set(range(len(state['clusters'])))
+    pairs = [None] * len(clusters)
+    for j, members in enumerate(clusters):
+        for fp in members:
+            i = owner.get(fp)
+            if i in unmatched:
+                pairs[j] = i
+                unmatched.discard(i)
+                break
+
+    by_identity = {}
+    for i in sorted(unmatched):
+        by_identity.setdefault(identity(state['merged'][i]), []).append(i)
+    for j, merged in enumerate(merged_clinics):
+        candidates = by_identity.get(identity(merged)) if pairs[j] is None else None
+        if candidates:
+            pairs[j] = candidates.pop(0)
+            unmatched.discard(pairs[j])
+
+    return {
+        'added': [merged for j, merged in enumerate(merged_clinics) if pairs[j] is None],
+        'removed': [state['merged'][i] for i in sorted(unmatched)],
+        'changed': [{'before': state['merged'][i], 'after': merged_clinics[j]}
+                    for j, i in enumerate(pairs)
+                    if i is not None and state['merged'][i] != merged_clinics[j]],
+    }
+
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Combine dental clinic data sources')
+    parser.add_argument('--base-path', default=str(Path(__file__).parent.parent),
+                        help='Project root (data/ and dentaltrawler/src/)')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help='Only process records new or changed since the last run')
+
+    args = parser.parse_args()
+
     print("="*60)
     print("Combining All Dental Clinic Data Sources")
     print("="*60)
 
-    base_path = Path("/Users/g/projects/dentaltrawler")
+    base_path = Path(args.base_path)
+    state_file = base_path / COMBINE_STATE_FILE
 
     # Load all data sources
     sources = [
@@ -64,56 +313,42 @@ def main():
         ("General Clinics", base_path / "data" / "dental_clinics_london.json"),
     ]
 
-    all_clinics = []
+    state = load_state(state_file) if args.incremental else None
+    if args.incremental and state is None:
+        print("\nℹ️  No previous state found, running a full combine")
 
-    for name, filepath in sources:
-        print(f"\n📂 Loading {name}...")
-        data = load_json_file(filepath)
-        print(f"   Found {len(data)} records")
-        all_clinics.extend(data)
+    records, source_state = load_sources(sources, state)
+    print(f"\n📊 Total raw records: {len(records)}")
 
-    print(f"\n📊 Total raw records: {len(all_clinics)}")
+    diff_file = base_path / COMBINE_DIFF_FILE
+    if state is not None and set(records) == set(state['records']):
+        save_diff(diff_file, {'added': [], 'removed': [], 'changed': []})
+        print("\n✅ No new or changed records since the last run, nothing to do")
+        return
 
-    # Deduplicate by name + phone/address
+    # Deduplicate: fuzzy record linkage over blocked candidate pairs,
+    # then merge each cluster of matching records
     print("\n🔄 Deduplicating...")
-    seen = {}
-    unique_clinics = []
+    clusters, unique_clinics, provenance, keys, matches = combine(records, source_state, state)
 
-    for clinic in all_clinics:
-        name = clinic.get('name', '')
-        if not name:
-            continue
+    print(f"   Unique clinics: {len(unique_clinics)}")
 
-        # Create identifier
-        norm_name = normalize_name(name)
-        norm_phone = normalize_phone(clinic.get('phone', ''))
-        postcode = (clinic.get('postcode') or '').replace(' ', '').upper()
-
-        # Try multiple identifiers
-        identifiers = [
-            f"{norm_name}:{norm_phone}" if norm_phone else None,
-            f"{norm_name}:{postcode}" if postcode else None,
-            norm_name if not norm_phone and not postcode else None,
-        ]
-
-        matched = False
-        for identifier in identifiers:
-            if identifier and identifier in seen:
-                # Merge with existing
-                idx = seen[identifier]
-                unique_clinics[idx] = merge_clinic_data(unique_clinics[idx], clinic)
-                matched = True
-                break
+    if state is not None:
+        diff = diff_clusters(state, clusters, unique_clinics)
+        save_diff(diff_file, diff)
+        print(f"   Diff: +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['changed'])} "
+              f"clinics (saved to {diff_file})")
 
-        if not matched:
-            # Add new clinic
-            idx = len(unique_clinics)
-            for identifier in identifiers:
-                if identifier:
-                    seen[identifier] = idx
-            unique_clinics.append(clinic)
-
-    print(f"   Unique clinics: {len(unique_clinics)}")
+    save_state(state_file, {
+        'version': STATE_VERSION,
+        'sources': source_state,
+        'records': records,
+        'keys': keys,
+        'matches': matches,
+        'clusters': clusters,
+        'merged': unique_clinics,
+        'provenance': provenance,
+    })
 
     # Sort by completeness (more data = higher priority)
     def completeness_score(clinic):
@@ -142,10 +377,19 @@ def main():
 
     # Save combined data
     output_json = base_path / "data" / "all_clinics_combined.json"
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(unique_clinics, f, indent=2, ensure_ascii=False)
+    raw = json.dumps(unique_clinics, indent=2, ensure_ascii=False).encode('utf-8')
+    output_json.write_bytes(raw)
     print(f"\n✅ Saved to {output_json}")
 
+    # Read-only SQLite store queried by the APIs
+    store_file = base_path / CLINIC_STORE_FILE
+    try:
+        meta = write_store(store_file, unique_clinics, data_version(raw))
+        print(f"✅ Built clinic store {store_file} ({meta['located']} clinics with coordinates)")
+    except sqlite3.OperationalError as e:
+        # e.g. SQLite built without FTS5 or R*Tree; the APIs fall back to the JSON
+        print(f"  ⚠️  Skipping clinic store {store_file}: {e}")
+
     # Update frontend clinics.js
     frontend_file = base_path / "dentaltrawler" / "src" / "clinics.js"
     js_content = "// London dental clinic data - Auto-generated\n"
@@ -3,63 +3,202 @@ Fetch dental clinic data using OpenStreetMap Overpass API
 FREE - No API key needed, better data than Nominatim
 """
 
+import codecs
 import json
+import re
 import requests
+import sys
 import time
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from _geo import element_coords
+
+# ijson is optional: without it a stdlib incremental parser is used
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Bounding box (south, west, north, east): roughly Greater London area
+LONDON_BBOX = (51.28, -0.51, 51.69, 0.33)
+
+OUTPUT_FILE = Path("data/dental_clinics_overpass.json")
+
+
+class OverpassRuntimeError(Exception):
+    """
+    Overpass gave up on the query (timeout, out of memory). It still
+    answers HTTP 200, with a "remark" after partial or empty elements.
+    """
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str = "elements",
+                    trailer: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Incrementally parse the objects in the top-level array under key from
+    a stream of JSON bytes, holding only the unparsed tail in memory
+
+    If trailer is given, the members of the top-level object that follow
+    the array (e.g. Overpass' "remark") are parsed into it at the end.
+    """
+    start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+
+    def read_more() -> bool:
+        """Append the next chunk, dropping the parsed prefix"""
+        nonlocal buffer, pos
+        for chunk in chunks:
+            if chunk:
+                buffer = buffer[pos:] + utf8.decode(chunk)
+                pos = 0
+                return True
+        buffer = buffer[pos:] + utf8.decode(b'', final=True)
+        pos = 0
+        return False
+
+    # Skip the header (version, generator, osm3s) up to the array
+    while True:
+        match = start_re.search(buffer)
+        if match:
+            pos = match.end()
+            break
+        if not read_more():
+            return
+
+    while True:
+        # Skip separators between objects
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            if not read_more():
+                return
+            continue
+        if buffer[pos] == ']':
+            if trailer is not None:
+                # What follows is small: ', "remark": "..." }'
+                while read_more():
+                    pass
+                rest = buffer[pos + 1:].strip().lstrip(',')
+                trailer.update(json.loads('{' + rest))
+            return
+
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Object split across chunks; a parse error at the end of the
+            # stream is a real one
+            if not read_more():
+                raise
+            continue
+        yield item
+
+
+def ijson_elements(stream, trailer: Dict) -> Iterator[Dict]:
+    """Objects in the top-level "elements" array via ijson, other top-level strings into trailer"""
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'elements.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'elements.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif '.' not in prefix and event == 'string':
+            trailer[prefix] = value
+
 
 class OverpassClient:
     """Client for OpenStreetMap Overpass API - better for bulk queries"""
 
-    def __init__(self):
-        self.base_url = "https://overpass-api.de/api/interpreter"
+    def __init__(self, base_url: str = "https://overpass-api.de/api/interpreter"):
+        self.base_url = base_url
         self.headers = {
             'User-Agent': 'DentalTrawler/1.0'
         }
 
-    def fetch_dentists_london(self) -> List[Dict]:
-        """Fetch all dentists in Greater London using Overpass QL"""
-        print("\n🔍 Fetching dentists from OpenStreetMap Overpass API...")
-        print("  (Free API - comprehensive data for London area)")
-
-        # Overpass QL query for dentists in Greater London
-        # Bounding box: roughly Greater London area
-        query = """
-        [out:json][timeout:60];
+    def build_query(self, bbox: Tuple[float, float, float, float], timeout: int = 60) -> str:
+        """Overpass QL query for dentists in a bounding box"""
+        bbox_str = ','.join(str(v) for v in bbox)
+        return f"""
+        [out:json][timeout:{timeout}];
         (
-          // Dentists in Greater London area
-          node["amenity"="dentist"](51.28,-0.51,51.69,0.33);
-          way["amenity"="dentist"](51.28,-0.51,51.69,0.33);
+          // Dentists in the area
+          node["amenity"="dentist"]({bbox_str});
+          way["amenity"="dentist"]({bbox_str});
 
           // Also get dental clinics
-          node["healthcare"="dentist"](51.28,-0.51,51.69,0.33);
-          way["healthcare"="dentist"](51.28,-0.51,51.69,0.33);
+          node["healthcare"="dentist"]({bbox_str});
+          way["healthcare"="dentist"]({bbox_str});
         );
-        out body;
-        >;
-        out skel qt;
+        out center;
         """
 
-        try:
-            response = requests.post(
-                self.base_url,
-                data={'data': query},
-                headers=self.headers,
-                timeout=90
-            )
+    def stream_elements(self, bbox: Tuple[float, float, float, float] = LONDON_BBOX,
+                        timeout: int = 60) -> Iterator[Dict]:
+        """
+        Stream tagged elements from the response body as they arrive
+
+        The payload is never held in memory as a whole. Ways come with
+        their center point (`out center`), so no member nodes are fetched;
+        any untagged elements are dropped while parsing. Raises
+        OverpassRuntimeError after the last element if Overpass reports a
+        runtime error, as the elements are then incomplete.
+        """
+        response = requests.post(
+            self.base_url,
+            data={'data': self.build_query(bbox, timeout)},
+            headers=self.headers,
+            timeout=timeout + 30,
+            stream=True
+        )
+        with response:
             response.raise_for_status()
-            data = response.json()
+            trailer = {}
+            if ijson is not None:
+                response.raw.decode_content = True
+                elements = ijson_elements(response.raw, trailer)
+            else:
+                elements = iter_json_array(response.iter_content(chunk_size=64 * 1024), trailer=trailer)
+
+            for element in elements:
+                if element.get('type') in ('node', 'way') and element.get('tags'):
+                    yield element
+
+        remark = trailer.get('remark') or ''
+        if 'runtime error' in remark:
+            raise OverpassRuntimeError(remark)
+
+    def fetch_dentists_london(self) -> List[Dict]:
+        """Fetch all dentists in Greater London using Overpass QL"""
+        print("\n🔍 Fetching dentists from OpenStreetMap Overpass API...")
+        print("  (Free API - comprehensive data for London area)")
 
-            elements = data.get('elements', [])
+        try:
+            elements = list(self.stream_elements(LONDON_BBOX))
             print(f"  Found {len(elements)} elements")
 
             return elements
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OverpassRuntimeError) as e:
             print(f"  ⚠️  API Error: {e}")
             return []
 
+    def stream_clinics(self, bbox: Tuple[float, float, float, float] = LONDON_BBOX,
+                       timeout: int = 60) -> Iterator[Dict]:
+        """Yield clinic dicts as elements arrive from Overpass"""
+        for element in self.stream_elements(bbox, timeout):
+            clinic = self.convert_to_clinic_format(element)
+            if clinic:
+                yield clinic
+
     def convert_to_clinic_format(self, element: Dict) -> Dict:
         """Convert Overpass element to clinic format"""
         tags = element.get('tags', {})
@@ -82,9 +221,8 @@ class OverpassClient:
 
         address = ', '.join(address_parts) if address_parts else ''
 
-        # Get coordinates
-        lat = element.get('lat')
-        lon = element.get('lon')
+        # Get coordinates (ways use their center point)
+        lat, lon = element_coords(element)
 
         # Extract phone (various formats in OSM)
         phone = (tags.get('phone') or
@@ -136,69 +274,101 @@ class OverpassClient:
             'opening_hours': opening_hours
         }
 
-    def save_results(self, clinics: List[Dict]):
-        """Save results to files"""
-        if not clinics:
-            print("⚠️  No clinics to save")
-            return
+    def save_results(self, clinics: Iterable[Dict], json_file: Path = OUTPUT_FILE) -> int:
+        """
+        Save results to files
 
-        # Save to JSON
-        json_file = Path("data/dental_clinics_overpass.json")
+        Clinics are written one by one as they arrive (same layout as
+        json.dump with indent=2) to a temporary file that replaces
+        json_file once complete. Returns the number saved.
+        """
         json_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(clinics, f, indent=2, ensure_ascii=False)
-        print(f"✅ Saved {len(clinics)} clinics to {json_file}")
+        tmp_file = json_file.with_name(json_file.name + '.tmp')
+
+        count = 0
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write('[')
+                for clinic in clinics:
+                    body = json.dumps(clinic, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+                    f.write(('\n  ' if count == 0 else ',\n  ') + body)
+                    count += 1
+                f.write('\n]' if count else ']')
+        except BaseException:
+            # e.g. OverpassRuntimeError from the stream: keep json_file as it was
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+        if not count:
+            tmp_file.unlink()
+            print("⚠️  No clinics to save")
+            return 0
 
-        return clinics
+        tmp_file.replace(json_file)
+        print(f"✅ Saved {count} clinics to {json_file}")
+        return count
 
 
 def main():
     """Main entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fetch dental clinics from OpenStreetMap Overpass API')
+    parser.add_argument('--bbox', default=','.join(str(v) for v in LONDON_BBOX),
+                        help='south,west,north,east (default: Greater London)')
+    parser.add_argument('--timeout', type=int, default=60, help='Overpass query timeout in seconds')
+    parser.add_argument('--output', '-o', default=str(OUTPUT_FILE), help='JSON file to write')
+
+    args = parser.parse_args()
+    bbox = tuple(float(v) for v in args.bbox.split(','))
+
     print("="*60)
     print("OpenStreetMap Overpass API - Dental Clinics")
     print("="*60)
     print("\n✅ FREE - No API key needed!")
-    print("📍 Fetching all dentists in Greater London area\n")
+    print(f"📍 Fetching all dentists in {args.bbox}\n")
 
     try:
         client = OverpassClient()
 
-        # Fetch dentists
-        elements = client.fetch_dentists_london()
+        # Stream elements, convert and write clinics as they arrive;
+        # only the stats and a few samples are kept in memory
+        print(f"\n📋 Streaming elements and converting to clinic format...")
+        stats = {'phone': 0, 'link': 0, 'address': 0}
+        samples = []
+
+        def tracked(clinics: Iterator[Dict]) -> Iterator[Dict]:
+            for clinic in clinics:
+                for field in stats:
+                    if clinic.get(field):
+                        stats[field] += 1
+                if len(samples) < 10:
+                    samples.append(clinic)
+                yield clinic
 
-        if not elements:
-            print("⚠️  No elements found")
+        try:
+            total = client.save_results(tracked(client.stream_clinics(bbox, args.timeout)),
+                                        Path(args.output))
+        except requests.exceptions.RequestException as e:
+            print(f"  ⚠️  API Error: {e}")
+            return
+        except OverpassRuntimeError as e:
+            print(f"  ⚠️  Overpass gave up on the query ({e}); try a higher --timeout or a smaller --bbox")
             return
 
-        # Convert to clinic format
-        print(f"\n📋 Converting elements to clinic format...")
-        clinics = []
-        for element in elements:
-            if element.get('type') in ('node', 'way') and element.get('tags'):
-                clinic = client.convert_to_clinic_format(element)
-                if clinic:
-                    clinics.append(clinic)
-
-        print(f"  Converted {len(clinics)} valid clinics")
-
-        if clinics:
-            client.save_results(clinics)
-
-            # Show stats
-            with_phone = sum(1 for c in clinics if c.get('phone'))
-            with_website = sum(1 for c in clinics if c.get('link'))
-            with_address = sum(1 for c in clinics if c.get('address'))
+        print(f"  Converted {total} valid clinics")
 
+        if total:
             print(f"\n{'='*60}")
-            print(f"✅ Complete! Found {len(clinics)} dental clinics")
+            print(f"✅ Complete! Found {total} dental clinics")
             print(f"{'='*60}")
             print(f"\nData quality:")
-            print(f"  📞 With phone: {with_phone} ({100*with_phone//len(clinics)}%)")
-            print(f"  🌐 With website: {with_website} ({100*with_website//len(clinics)}%)")
-            print(f"  📍 With address: {with_address} ({100*with_address//len(clinics)}%)")
+            print(f"  📞 With phone: {stats['phone']} ({100*stats['phone']//total}%)")
+            print(f"  🌐 With website: {stats['link']} ({100*stats['link']//total}%)")
+            print(f"  📍 With address: {stats['address']} ({100*stats['address']//total}%)")
 
             print(f"\nSample results:")
-            for i, clinic in enumerate(clinics[:10], 1):
+            for i, clinic in enumerate(samples, 1):
                 print(f"\n{i}. {clinic.get('name', 'Unknown')}")
                 if clinic.get('address'):
                     print(f"   📍 {clinic.get('address')}")
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Harvest dental clinics from the Overpass API tile by tile
+- A region is split into tiles fetched with bounded concurrency
+- Each endpoint serves one request at a time, spaced MIN_REQUEST_INTERVAL apart
+- Failed tiles are retried with exponential backoff, on another endpoint if any
+- Tiles too heavy for Overpass (a runtime error such as a query timeout,
+  reported with HTTP 200) are split into quarters and fetched again
+- Completed tiles are checkpointed to disk, so an interrupted run resumes
+- Once every tile is done, clinics are merged (deduplicated by OSM id,
+  since ways can cross tile edges) and the output file is replaced
+  atomically; until then it is left untouched
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from math import ceil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fetch_overpass import LONDON_BBOX, OUTPUT_FILE, OverpassClient, OverpassRuntimeError
+
+BBox = Tuple[float, float, float, float]
+
+# Named regions (south, west, north, east)
+REGIONS = {
+    'london': LONDON_BBOX,
+    'uk': (49.8, -8.7, 60.9, 1.8),
+}
+
+# Public Overpass instances
+ENDPOINTS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+]
+
+MIN_REQUEST_INTERVAL = 2.0  # seconds between requests to one endpoint
+MAX_RETRIES = 5
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 120.0
+MAX_SPLIT_DEPTH = 3         # a tile is split into at most 4^3 = 64 parts
+
+CHECKPOINT_ROOT = Path("data/overpass_tiles")
+
+
+def split_tiles(bbox: BBox, tile_size: float) -> List[BBox]:
+    """Split a bounding box into tiles of at most tile_size degrees"""
+    south, west, north, east = bbox
+    rows = max(1, ceil(round((north - south) / tile_size, 9)))
+    cols = max(1, ceil(round((east - west) / tile_size, 9)))
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            tiles.append((
+                round(south + r * tile_size, 6),
+                round(west + c * tile_size, 6),
+                round(min(south + (r + 1) * tile_size, north), 6),
+                round(min(west + (c + 1) * tile_size, east), 6),
+            ))
+    return tiles
+
+
+def quarters(tile: BBox) -> List[BBox]:
+    """The four quarters of a tile"""
+    south, west, north, east = tile
+    mid_lat = round((south + north) / 2, 6)
+    mid_lon = round((west + east) / 2, 6)
+    return [
+        (south, west, mid_lat, mid_lon),
+        (south, mid_lon, mid_lat, east),
+        (mid_lat, west, north, mid_lon),
+        (mid_lat, mid_lon, north, east),
+    ]
+
+
+def tile_name(tile: BBox) -> str:
+    return "_".join(f"{v:.6f}" for v in tile)
+
+
+class Endpoint:
+    """An Overpass server polled politely: one request at a time, spaced out"""
+
+    def __init__(self, url: str, min_interval: float = MIN_REQUEST_INTERVAL):
+        self.url = url
+        self.client = OverpassClient(url)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def back_off(self, seconds: float):
+        """Don't send anything to this endpoint for a while (e.g. after a 429)"""
+        self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+    def fetch(self, tile: BBox, timeout: int) -> Dict[str, Dict]:
+        """Clinics in a tile keyed by OSM id ("node/123", "way/456")"""
+        with self._lock:
+            wait = self._next_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                clinics = {}
+                for element in self.client.stream_elements(tile, timeout):
+                    clinic = self.client.convert_to_clinic_format(element)
+                    if clinic:
+                        clinics[f"{element['type']}/{element['id']}"] = clinic
+                return clinics
+            finally:
+                self.back_off(self.min_interval)
+
+
+class Harvester:
+    """Tiled, resumable Overpass harvest merged into one clinic file"""
+
+    def __init__(self, tiles: List[BBox], checkpoint_dir: Path, output: Path,
+                 endpoints: List[Endpoint], timeout: int = 90):
+        self.tiles = tiles
+        self.checkpoint_dir = checkpoint_dir
+        self.output = output
+        self.endpoints = endpoints
+        self.timeout = timeout
+        self.store: Dict[str, Dict] = {}
+        self.failed: List[BBox] = []
+        self._lock = threading.Lock()
+
+    def checkpoint_file(self, tile: BBox) -> Path:
+        return self.checkpoint_dir / f"{tile_name(tile)}.json"
+
+    def resume(self) -> List[BBox]:
+        """Merge checkpointed tiles into the store; returns the tiles still to fetch"""
+        pending = []
+        for tile in self.tiles:
+            path = self.checkpoint_file(tile)
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.store.update(json.load(f)['clinics'])
+            else:
+                pending.append(tile)
+        return pending
+
+    def pick_endpoint(self, avoid: Optional[Endpoint]) -> Endpoint:
+        """Idle endpoint that's free soonest, avoiding the one that just failed"""
+        candidates = [e for e in self.endpoints if e is not avoid] or self.endpoints
+        return min(candidates, key=lambda e: (e.busy(), e._next_at))
+
+    def fetch_tile(self, tile: BBox, depth: int = 0) -> Optional[Dict[str, Dict]]:
+        """
+        Fetch one tile, retrying with exponential backoff; None if it keeps
+        failing. A tile Overpass gives up on is fetched as quarters instead.
+        """
+        endpoint = None
+        for attempt in range(MAX_RETRIES):
+            endpoint = self.pick_endpoint(endpoint)
+            try:
+                return endpoint.fetch(tile, self.timeout)
+            except Exception as e:
+                if isinstance(e, OverpassRuntimeError) and depth < MAX_SPLIT_DEPTH:
+                    print(f"  ✂️  Tile {tile_name(tile)} too heavy for {endpoint.url} ({e}), splitting it")
+                    return self.fetch_split(tile, depth + 1)
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                response = getattr(e, 'response', None)
+                if response is not None and response.status_code == 429:
+                    # Rate limited: rest the endpoint for as long as it asks
+                    retry_after = response.headers.get('Retry-After', '')
+                    endpoint.back_off(float(retry_after) if retry_after.isdigit() else delay)
+                print(f"  ⚠️  Tile {tile_name(tile)} failed on {endpoint.url} "
+                      f"(attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+                if attempt + 1 < MAX_RETRIES:
+                    time.sleep(delay)
+        return None
+
+    def fetch_split(self, tile: BBox, depth: int) -> Optional[Dict[str, Dict]]:
+        """Clinics in a tile fetched as quarters; None if any quarter fails"""
+        clinics = {}
+        for part in quarters(tile):
+            part_clinics = self.fetch_tile(part, depth)
+            if part_clinics is None:
+                return None
+            clinics.update(part_clinics)
+        return clinics
+
+    def save_checkpoint(self, tile: BBox, clinics: Dict[str, Dict]):
+        path = self.checkpoint_file(tile)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'bbox': list(tile), 'clinics': clinics}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def complete(self, tile: BBox, clinics: Dict[str, Dict]):
+        """Checkpoint a finished tile and merge it into the store"""
+        self.save_checkpoint(tile, clinics)
+        with self._lock:
+            self.store.update(clinics)
+
+    def run(self, workers: int) -> bool:
+        """
+        Harvest all pending tiles; True if every tile succeeded, in which
+        case the output file is replaced with the merged clinics
+        """
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        pending = self.resume()
+        done = len(self.tiles) - len(pending)
+        if done:
+            print(f"  ↩️  Resuming: {done}/{len(self.tiles)} tiles already done "
+                  f"({len(self.store)} clinics)")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.fetch_tile, tile): tile for tile in pending}
+            for future in as_completed(futures):
+                tile = futures[future]
+                clinics = future.result()
+                if clinics is None:
+                    self.failed.append(tile)
+                    continue
+                self.complete(tile, clinics)
+                done += 1
+                print(f"  ✓ {done}/{len(self.tiles)} tiles, {len(clinics)} clinics in "
+                      f"{tile_name(tile)} ({len(self.store)} total)")
+
+        if self.failed:
+            # Partial results stay in the checkpoints only
+            return False
+        OverpassClient().save_results(iter(self.store.values()), self.output)
+        return True
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Harvest dental clinics from Overpass tile by tile')
+    parser.add_argument('--region', '-r', default='london', choices=sorted(REGIONS),
+                        help='Named region to harvest')
+    parser.add_argument('--bbox', help='south,west,north,east (overrides --region)')
+    parser.add_argument('--tile-size', type=float, default=0.25, help='Tile size in degrees')
+    parser.add_argument('--workers', '-w', type=int, default=len(ENDPOINTS),
+                        help='Tiles fetched concurrently (each endpoint still serves one at a time)')
+    parser.add_argument('--timeout', type=int, default=90, help='Overpass query timeout per tile in seconds')
+    parser.add_argument('--output', '-o',
+                        help=f'Merged JSON file to write (default {OUTPUT_FILE}; required with --bbox)')
+    parser.add_argument('--checkpoints', help='Checkpoint directory (default: per region and tile size)')
+    parser.add_argument('--restart', action='store_true', help='Ignore existing checkpoints')
+
+    args = parser.parse_args()
+
+    if args.bbox and not args.output:
+        # Don't replace the London data with another area by accident
+        parser.error("--bbox needs an explicit --output")
+
+    if args.bbox:
+        bbox = tuple(float(v) for v in args.bbox.split(','))
+        name = tile_name(bbox)
+    else:
+        bbox = REGIONS[args.region]
+        name = args.region
+    checkpoint_dir = Path(args.checkpoints or CHECKPOINT_ROOT / f"{name}_{args.tile_size:g}")
+
+    if args.restart and checkpoint_dir.exists():
+        for path in checkpoint_dir.glob('*.json'):
+            path.unlink()
+
+    tiles = split_tiles(bbox, args.tile_size)
+
+    print("="*60)
+    print("OpenStreetMap Overpass API - Tiled Harvest")
+    print("="*60)
+    print(f"\n📍 Region {bbox}: {len(tiles)} tiles of {args.tile_size:g}°")
+    print(f"💾 Checkpoints: {checkpoint_dir}\n")
+
+    harvester = Harvester(tiles, checkpoint_dir, Path(args.output or OUTPUT_FILE),
+                          [Endpoint(url) for url in ENDPOINTS], timeout=args.timeout)
+    ok = harvester.run(args.workers)
+
+    print(f"\n{'='*60}")
+    if ok:
+        print(f"✅ Complete! {len(harvester.store)} clinics from {len(tiles)} tiles")
+    else:
+        print(f"⚠️  {len(harvester.failed)} tiles failed; run again to retry them "
+              f"(output not written yet)")
+        for tile in harvester.failed:
+            print(f"   {tile_name(tile)}")
+    print(f"{'='*60}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
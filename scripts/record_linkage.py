@@ -0,0 +1,451 @@
+"""
+Record linkage for combining clinic data sources
+Finds records describing the same clinic despite typos, reordered words
+or different phone formats, without comparing every pair:
+- Blocking: records are only compared if they share a postcode (or its
+  outward code), phone suffix, rare name trigram or nearby geohash cell
+- Scoring: only candidate pairs get the (slower) name and geo similarity
+- Clustering: matched pairs are joined transitively with union-find
+- Incremental: given the previous run's matches and the blocks that
+  changed, only records whose candidates may differ are compared again,
+  and the clusters come out as if everything was linked from scratch
+"""
+
+from collections import defaultdict
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import re
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "api"))
+from _geo import haversine_km
+from _search_index import outward_code
+
+# Blocks bigger than this (e.g. a trigram in every other name) are
+# skipped: they would cost O(size^2) comparisons and carry no signal
+MAX_BLOCK_SIZE = 50
+
+# Each record looks for candidates under its rarest name trigrams only
+RARE_TRIGRAMS = 3
+
+# Digits of a phone number compared, so "+44 20 ..." matches "020 ..."
+PHONE_SUFFIX_DIGITS = 10
+
+# Geohash precision 7 cells are about 150 x 150 m
+GEOHASH_PRECISION = 7
+
+# Matched pairs (i, j), i < j, and how strongly they match
+Matches = Dict[Tuple[int, int], float]
+
+# A cluster's phone suffixes, postcodes and coordinates
+Identifiers = Tuple[Set[str], Set[str], List[Tuple[float, float]]]
+
+# Match thresholds on name similarity (0..1) given other evidence
+NAME_MATCH_SAME_PHONE = 0.5
+NAME_MATCH_SAME_PLACE = 0.7
+NAME_MATCH_NAME_ONLY = 0.9
+
+# Distances in km: "same place" and "too far apart to be the same clinic"
+SAME_PLACE_KM = 0.1
+MAX_MATCH_KM = 1.0
+
+
+def normalize_name(name: str) -> str:
+    """Normalize clinic name for comparison"""
+    if not name:
+        return ''
+    # Lowercase, remove common words, extra spaces
+    name = name.lower().strip()
+    name = re.sub(r'\b(dental|dentist|surgery|practice|clinic|centre|center|ltd|limited)\b', '', name)
+    name = re.sub(r'[^\w\s]', '', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    return name
+
+
+def name_numbers(name: str) -> Set[str]:
+    """Number tokens in a name ("Number 18 Dental" -> {"18"})"""
+    return set(re.findall(r'\d+', name or ''))
+
+
+def street_name(address: str) -> str:
+    """
+    Lowercased street of an address without the house number
+    ("271, Northolt Road, HA2 8HS" -> "northolt road"), or ''
+    """
+    for part in (address or '').split(','):
+        part = re.sub(r'^[\d\s\-/]+[a-z]?\b', '', part.strip().lower()).strip()
+        if re.search(r'[a-z]', part):
+            return ' '.join(part.split())
+    return ''
+
+
+def phone_suffix(phone: str) -> str:
+    """Last PHONE_SUFFIX_DIGITS digits of a phone number, or '' if too short"""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-PHONE_SUFFIX_DIGITS:] if len(digits) >= PHONE_SUFFIX_DIGITS - 1 else ''
+
+
+def name_trigrams(norm_name: str) -> Set[str]:
+    """Character trigrams of a normalized name (padded, so short names count)"""
+    padded = f"  {norm_name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def rare_trigram_keys(keys: Iterable[str], size: Callable[[str], int]) -> List[str]:
+    """The RARE_TRIGRAMS name trigram keys among keys with the smallest blocks"""
+    trigram_keys = sorted((key for key in keys if key.startswith('t:')), key=lambda key: (size(key), key))
+    return trigram_keys[:RARE_TRIGRAMS]
+
+
+def neighbour_cells(cell_key: str) -> List[str]:
+    """Keys of a geohash cell key's cell and the 8 cells around it"""
+    _, row, col = cell_key.split(':')
+    row, col = int(row), int(col)
+    return [f"g:{row + i}:{col + j}" for i in (-1, 0, 1) for j in (-1, 0, 1)]
+
+
+def geohash_cell(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> Tuple[int, int]:
+    """
+    (row, column) of a point's geohash cell: the integer lat/lon halves of
+    the geohash bit string, which identify the same cell as the base32 hash
+    but make neighbours a matter of +-1
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    row = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    col = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return row, col
+
+
+class LinkRecord:
+    """The normalized fields of one clinic used for blocking and scoring"""
+
+    __slots__ = ('full_name', 'name', 'tokens', 'trigrams', 'numbers', 'phone', 'postcode',
+                 'outward', 'street', 'lat', 'lon', 'cell', 'keys')
+
+    def __init__(self, clinic: Dict):
+        raw_name = clinic.get('name') or ''
+        self.full_name = ' '.join(raw_name.lower().split())
+        # Names made only of generic words ("Dental Surgery") stay as they are
+        self.name = normalize_name(raw_name) or raw_name.lower().strip()
+        self.tokens = ' '.join(sorted(self.name.split()))
+        self.trigrams = name_trigrams(self.name) if self.name else set()
+        self.numbers = name_numbers(raw_name)
+        self.phone = phone_suffix(clinic.get('phone') or '')
+        self.postcode = (clinic.get('postcode') or '').replace(' ', '').upper()
+        self.outward = outward_code(self.postcode)
+        self.street = street_name(clinic.get('address') or '')
+        lat, lon = clinic.get('lat'), clinic.get('lon')
+        self.lat = lat if lat is not None and lon is not None else None
+        self.lon = lon if self.lat is not None else None
+        self.cell = geohash_cell(self.lat, self.lon) if self.lat is not None else None
+        self.keys = self.index_keys()
+
+    def index_keys(self) -> Set[str]:
+        """Blocks this record is filed under"""
+        keys = {f"t:{t}" for t in self.trigrams}
+        if self.name:
+            keys.add(f"n:{self.name}")
+        if self.phone:
+            keys.add(f"p:{self.phone}")
+        if self.postcode:
+            keys.add(f"pc:{self.postcode}")
+        if self.outward:
+            # Outward codes hold hundreds of clinics in busy areas: split by initial
+            keys.add(f"o:{self.outward}:{self.tokens[:1]}")
+        if self.cell is not None:
+            keys.add(f"g:{self.cell[0]}:{self.cell[1]}")
+        return keys
+
+    def probe_keys(self, blocks: Dict[str, List[int]]) -> Set[str]:
+        """
+        Blocks searched for this record's candidates: its own blocks, but
+        only the RARE_TRIGRAMS rarest name trigrams, and the neighbouring
+        geohash cells too
+        """
+        keys = {key for key in self.keys if key[:2] not in ('t:', 'g:')}
+        keys.update(rare_trigram_keys(self.keys, lambda key: len(blocks.get(key, ()))))
+        if self.cell is not None:
+            keys.update(neighbour_cells(f"g:{self.cell[0]}:{self.cell[1]}"))
+        return keys
+
+    def reaches(self, j: int, blocks: Dict[str, List[int]]) -> bool:
+        """Whether probing this record finds record j"""
+        for key in self.probe_keys(blocks):
+            block = blocks.get(key)
+            if block and len(block) <= MAX_BLOCK_SIZE and j in block:
+                return True
+        return False
+
+
+def name_similarity(a: LinkRecord, b: LinkRecord, threshold: float = 0.0) -> float:
+    """
+    0..1 similarity of normalized names: trigram overlap or token-sorted
+    edit ratio. The edit ratio is skipped when its upper bound can't
+    reach threshold.
+    """
+    if not a.name or not b.name:
+        return 0.0
+    if a.name == b.name:
+        return 1.0
+    jaccard = len(a.trigrams & b.trigrams) / len(a.trigrams | b.trigrams)
+    if jaccard >= threshold:
+        return jaccard
+    matcher = SequenceMatcher(None, a.tokens, b.tokens)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return jaccard
+    return max(jaccard, matcher.ratio())
+
+
+def match_strength(a: LinkRecord, b: LinkRecord) -> float:
+    """
+    How strongly two records look like the same clinic: 0 for no match,
+    otherwise higher for stronger evidence (shared phone > same place >
+    name alone) and more similar names
+    """
+    distance = None
+    if a.lat is not None and b.lat is not None:
+        distance = haversine_km(a.lat, a.lon, b.lat, b.lon)
+        if distance > MAX_MATCH_KM:
+            return 0.0
+
+    same_phone = bool(a.phone) and a.phone == b.phone
+    same_postcode = bool(a.postcode) and a.postcode == b.postcode
+    same_place = same_postcode or (distance is not None and distance <= SAME_PLACE_KM)
+
+    # Conflicting identifiers: different phones at different places, or
+    # different full postcodes (chains share one booking number)
+    if a.phone and b.phone and not same_phone and not same_place:
+        return 0.0
+    if a.postcode and b.postcode and not same_postcode:
+        return 0.0
+
+    if same_phone:
+        threshold, evidence = NAME_MATCH_SAME_PHONE, 3
+    elif same_place:
+        threshold, evidence = NAME_MATCH_SAME_PLACE, 2
+    elif a.outward and b.outward and a.outward != b.outward:
+        return 0.0
+    else:
+        # Different numbers in the names ("Number 1" / "Number 18") or
+        # different streets rule out a match on name. Names that aren't
+        # identical ("Carlton" / "Charlton", "Albany Dental Practice" /
+        # "Albany Dental Centre") also need the records located near each
+        # other: coordinates within MAX_MATCH_KM, the same outward code or
+        # the same street
+        if a.numbers and b.numbers and a.numbers != b.numbers:
+            return 0.0
+        if a.street and b.street and a.street != b.street:
+            return 0.0
+        located_near = (distance is not None or (a.outward and a.outward == b.outward)
+                        or (a.street and a.street == b.street))
+        if not located_near and a.full_name != b.full_name:
+            return 0.0
+        threshold, evidence = NAME_MATCH_NAME_ONLY, 1
+
+    similarity = name_similarity(a, b, threshold)
+    return evidence + similarity if similarity >= threshold else 0.0
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with path halving and union by size"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        """Join the sets of a and b; returns the root of the joined set"""
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+
+def build_blocks(keys: Sequence[Iterable[str]]) -> Dict[str, List[int]]:
+    """Blocking key -> record ids, from each record's index keys"""
+    blocks = defaultdict(list)
+    for i, record_keys in enumerate(keys):
+        for key in record_keys:
+            blocks[key].append(i)
+    return blocks
+
+
+def candidate_pairs(probes: Iterable[Tuple[int, LinkRecord]],
+                    blocks: Dict[str, List[int]]) -> Set[Tuple[int, int]]:
+    """(i, j) pairs with i < j where probing record i shares a usable block with j"""
+    pairs = set()
+    for i, record in probes:
+        for key in record.probe_keys(blocks):
+            block = blocks.get(key)
+            if not block or len(block) > MAX_BLOCK_SIZE:
+                continue
+            for j in block:
+                if j > i:
+                    pairs.add((i, j))
+                elif j < i:
+                    pairs.add((j, i))
+    return pairs
+
+
+def clinic_identifiers(clinic: Dict) -> Identifiers:
+    """({phone suffix}, {postcode}, [(lat, lon)]) of a clinic, empty where missing"""
+    phone = phone_suffix(clinic.get('phone') or '')
+    postcode = (clinic.get('postcode') or '').replace(' ', '').upper()
+    lat, lon = clinic.get('lat'), clinic.get('lon')
+    points = [(lat, lon)] if lat is not None and lon is not None else []
+    return ({phone} if phone else set()), ({postcode} if postcode else set()), points
+
+
+def identifiers_conflict(a: Identifiers, b: Identifiers) -> bool:
+    """
+    Whether two clusters' identifiers rule out merging them: different
+    postcodes, different phones without a shared postcode, or located
+    members more than MAX_MATCH_KM apart
+    """
+    phones_a, postcodes_a, points_a = a
+    phones_b, postcodes_b, points_b = b
+    if postcodes_a and postcodes_b and not postcodes_a & postcodes_b:
+        return True
+    if phones_a and phones_b and not phones_a & phones_b and not postcodes_a & postcodes_b:
+        return True
+    return any(haversine_km(lat_a, lon_a, lat_b, lon_b) > MAX_MATCH_KM
+               for lat_a, lon_a in points_a for lat_b, lon_b in points_b)
+
+
+def affected_records(keys: Sequence[Iterable[str]], blocks: Dict[str, List[int]],
+                     changed: Dict[str, int]) -> Set[int]:
+    """
+    Records whose candidates may differ from the previous run
+
+    changed maps each block key that gained or lost records since then
+    (the keys of added and removed records) to its change in size. A
+    record's candidates come from its own blocks, the cells around its own
+    and its rarest trigrams, so it is affected if any of those blocks
+    changed, or if a changed trigram block size changes which trigrams
+    are its rarest.
+    """
+    affected = set()
+    for key in changed:
+        if key.startswith('g:'):
+            for cell in neighbour_cells(key):
+                affected.update(blocks.get(cell, ()))
+        elif not key.startswith('t:'):
+            affected.update(blocks.get(key, ()))
+
+    def new_size(key: str) -> int:
+        return len(blocks.get(key, ()))
+
+    def old_size(key: str) -> int:
+        return new_size(key) - changed.get(key, 0)
+
+    checked = set()
+    for key in changed:
+        if not key.startswith('t:'):
+            continue
+        for i in blocks.get(key, ()):
+            if i in affected or i in checked:
+                continue
+            checked.add(i)
+            rarest = rare_trigram_keys(keys[i], new_size)
+            if any(k in changed for k in rarest) or rarest != rare_trigram_keys(keys[i], old_size):
+                affected.add(i)
+    return affected
+
+
+def cluster_matches(clinics: Sequence[Dict], matches: Matches) -> List[List[int]]:
+    """
+    Join matched pairs strongest first (ties by index). A join is refused
+    when the two clusters' phones, postcodes or locations conflict, so a
+    record without them can't chain unrelated branches of a chain together.
+    """
+    union_find = UnionFind(len(clinics))
+    identifiers = {i: clinic_identifiers(clinic) for i, clinic in enumerate(clinics)}
+
+    for _, i, j in sorted((-strength, i, j) for (i, j), strength in matches.items()):
+        ri, rj = union_find.find(i), union_find.find(j)
+        if ri == rj or identifiers_conflict(identifiers[ri], identifiers[rj]):
+            continue
+        root = union_find.union(ri, rj)
+        other = identifiers.pop(rj if root == ri else ri)
+        identifiers[root][0].update(other[0])
+        identifiers[root][1].update(other[1])
+        identifiers[root][2].extend(other[2])
+
+    result = defaultdict(list)
+    for i in range(len(clinics)):
+        result[union_find.find(i)].append(i)
+    return sorted(result.values(), key=lambda members: members[0])
+
+
+def link_records(clinics: Sequence[Dict],
+                 keys: Optional[Sequence[Optional[Iterable[str]]]] = None,
+                 previous: Optional[Matches] = None,
+                 changed: Optional[Dict[str, int]] = None) -> Tuple[List[List[int]], Matches]:
+    """
+    Cluster clinics describing the same place
+
+    keys may hold each clinic's stored index keys (None where unknown), so
+    clinics aren't normalized again unless they are compared.
+
+    For incremental linking, pass the previous run's matches between the
+    clinics still present (re-indexed) and the changed block keys (see
+    affected_records). Pairs between unaffected clinics keep their
+    previous result; every affected clinic is probed again, and a previous
+    pair with one affected side is kept only if the unaffected side still
+    finds it. The matches, and so the clusters, are then exactly those of
+    a full run, as long as clinics are in the same order.
+
+    Returns clusters of indices into clinics, each in index order, ordered
+    by their first member, and the matched pairs.
+    """
+    records: List[Optional[LinkRecord]] = [None] * len(clinics)
+
+    def record(i: int) -> LinkRecord:
+        if records[i] is None:
+            records[i] = LinkRecord(clinics[i])
+        return records[i]
+
+    def score(pairs: Iterable[Tuple[int, int]], matches: Matches):
+        for i, j in pairs:
+            if (i, j) not in matches:
+                strength = match_strength(record(i), record(j))
+                if strength:
+                    matches[(i, j)] = strength
+
+    if keys is None:
+        keys = [None] * len(clinics)
+    keys = [k if k is not None else record(i).keys for i, k in enumerate(keys)]
+    blocks = build_blocks(keys)
+
+    matches: Matches = {}
+    if previous is None:
+        score(candidate_pairs(((i, record(i)) for i in range(len(clinics))), blocks), matches)
+        return cluster_matches(clinics, matches), matches
+
+    affected = affected_records(keys, blocks, changed or {})
+    for (i, j), strength in previous.items():
+        if i not in affected and j not in affected:
+            matches[(i, j)] = strength
+    score(candidate_pairs(((i, record(i)) for i in sorted(affected)), blocks), matches)
+    for (i, j), strength in previous.items():
+        if (i, j) in matches or (i in affected and j in affected):
+            continue
+        # Found by the unaffected side's unchanged probe, or only by the
+        # affected side's old one
+        unaffected, other = (j, i) if i in affected else (i, j)
+        if record(unaffected).reaches(other, blocks):
+            matches[(i, j)] = strength
+    return cluster_matches(clinics, matches), matches